@@ -1,83 +1,297 @@
 import graphviz
 import itertools
 import json
-from itertools import chain, product
-from typing import Dict, NamedTuple, Optional, Set, Tuple
+import math
+import mmap
+import numpy as np
+from array import array
+from collections import defaultdict, deque
+from functools import cached_property
+from itertools import chain
+from typing import Dict, FrozenSet, NamedTuple, Optional, Set, Tuple
 
 Symbol = str
 State = str
 
+# automata up to this many states count long words by squaring their
+# adjacency matrix rather than stepping through the table
+_DENSE_STATES = 256
 
-class DFA(NamedTuple):
+
+class _DFA(NamedTuple):
     alphabet: Set[Symbol]
     states: Set[State]
     initial_state: State
     transitions: Dict[Tuple[Symbol, State], State]
     final_states: Set[State]
 
+
+class DFA(_DFA):
+    # missing transitions go to ERROR, which loops on every symbol and is
+    # only final when listed in final_states (as in complements). Not a
+    # NamedTuple itself so instances get a __dict__ for cached indexes.
+    ERROR = '-'
+
     def complete(self):
         transitions = self.transitions.copy()
         for state, symbol in itertools.product(self.states, self.alphabet):
-            transitions.setdefault((state, symbol), '-')
+            transitions.setdefault((state, symbol), self.ERROR)
 
         if transitions != self.transitions:
             transitions.update({
-                ('-', symbol): '-' for symbol in self.alphabet
+                (self.ERROR, symbol): self.ERROR for symbol in self.alphabet
                 })
 
         return DFA.create(
             initial_state=self.initial_state,
             transitions=transitions,
             final_states=self.final_states,
+            alphabet=self.alphabet,
             )
 
     def __add__(self, other):
         return self.concatenate(other)
 
     def concatenate(self, other):
-        return self.to_nfa().concatenate(other.to_nfa()).to_dfa()
+        # trimming may drop symbols that complements still need
+        dfa = self.trim().to_nfa().concatenate(other.to_nfa().trim()).to_dfa()
+        return dfa._replace(alphabet=self.alphabet | other.alphabet)
 
     def __sub__(self, other):
         return self.difference(other)
 
     def difference(self, other):
-        return self.complement().union(other).complement()
+        return self.product(other, lambda a, b: a and not b)
 
     def __invert__(self):
         return self.complement()
 
     def complement(self):
-        complete = self.complete()
         return DFA.create(
-            initial_state=complete.initial_state,
-            transitions=complete.transitions,
-            final_states=complete.states - complete.final_states,
+            initial_state=self.initial_state,
+            transitions=self.transitions,
+            final_states=(self.states | {self.ERROR}) - self.final_states,
+            alphabet=self.alphabet,
             )
 
     def __and__(self, other):
         return self.intersect(other)
 
     def intersect(self, other):
-        return self.complement().union(other.complement()).complement()
+        return self.product(other, lambda a, b: a and b)
 
     def __or__(self, other):
         return self.union(other)
 
     def union(self, other):
-        return self.to_nfa().union(other.to_nfa()).to_dfa()
+        return self.product(other, lambda a, b: a or b)
 
-    def remove_unreachable(self):
-        reachable = {self.initial_state, }
-        states = {self.initial_state, }
+    def __xor__(self, other):
+        return self.symmetric_difference(other)
+
+    def symmetric_difference(self, other):
+        return self.product(other, lambda a, b: a != b)
+
+    def product(self, other, accept):
+        this, that = self.trim().compile(), other.to_dfa().trim().compile()
+
+        trans = {(this.initial_state, that.initial_state): 'q0'}
+        transitions = {}
+
+        for state, symbols, new_state in _pairs(this, that, accept):
+            if new_state not in trans:
+                trans[new_state] = f'q{len(trans)}'
+            for symbol in symbols:
+                transitions[(trans[state], symbol)] = trans[new_state]
+
+        return DFA.create(
+            initial_state='q0',
+            transitions=transitions,
+            final_states={
+                trans[p, q] for p, q in trans
+                if accept(p in this.final_states, q in that.final_states)
+                },
+            alphabet=this.symbols.keys() | that.symbols.keys(),
+            )
+
+    def product_witness(self, other, accept) -> Optional[str]:
+        # shortest word taking the product to a final pair, found without
+        # building it; None if there is none
+        this, that = self.trim().compile(), other.to_dfa().trim().compile()
+
+        def is_final(pair):
+            p, q = pair
+            return accept(p in this.final_states, q in that.final_states)
+
+        initial_state = (this.initial_state, that.initial_state)
+        if is_final(initial_state):
+            return ''
 
-        def reachable_from(states):
-            for key in product(states, self.alphabet):
-                if key in self.transitions:
-                    yield self.transitions[key]
+        previous = {initial_state: None}
+        for state, symbols, new_state in _pairs(this, that, accept):
+            if new_state in previous:
+                continue
+
+            previous[new_state] = (state, symbols[0])
+            if is_final(new_state):
+                word = []
+                while previous[new_state]:
+                    new_state, symbol = previous[new_state]
+                    word.append(symbol)
+                return ''.join(reversed(word))
+
+        return None
+
+    def is_empty(self) -> bool:
+        return self.shortest_word() is None
+
+    def shortest_word(self) -> Optional[str]:
+        previous = {self.initial_state: None}
+        states = deque([self.initial_state])
+        alphabet = sorted(self.alphabet)
 
         while states:
-            states = {state for state in reachable_from(states)} - reachable
-            reachable |= states
+            state = states.popleft()
+            if state in self.final_states:
+                word = []
+                while previous[state]:
+                    state, symbol = previous[state]
+                    word.append(symbol)
+                return ''.join(reversed(word))
+
+            for symbol in alphabet:
+                new_state = self._move(state, symbol)
+                if new_state is not None and new_state not in previous:
+                    previous[new_state] = (state, symbol)
+                    states.append(new_state)
+
+        return None
+
+    def count(self, n: int) -> int:
+        # how many words of length n over the alphabet are accepted
+        return _count(self.trim().compile(), n)
+
+    def count_upto(self, n: int) -> int:
+        # how many words of length at most n are accepted
+        return _count(self.trim().compile(), n, upto=True)
+
+    def is_finite(self) -> bool:
+        return _longest(self.trim().compile()) is not None
+
+    def max_word_length(self) -> Optional[int]:
+        # None when there is no longest word, the language being either
+        # empty or infinite
+        longest = _longest(self.trim().compile())
+        return None if longest is None or longest < 0 else longest
+
+    def intersects(self, other) -> bool:
+        return self.product_witness(other, lambda a, b: a and b) is not None
+
+    def disjoint(self, other) -> bool:
+        return not self.intersects(other)
+
+    def equivalent(self, other) -> bool:
+        return self.counterexample(other) is None
+
+    def counterexample(self, other) -> Optional[str]:
+        # Hopcroft-Karp: merge the classes of paired states with union-find
+        # and only follow pairs that were not already known equivalent; the
+        # first pair that disagrees on finality gives a word accepted by
+        # exactly one of the automata. `None` is the error state.
+        this, other = self.trim(), other.to_dfa().trim()
+        alphabet = sorted(this.alphabet | other.alphabet)
+        parent = {}
+
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        def word(pair):
+            symbols = []
+            while pair in previous:
+                pair, symbol = previous[pair]
+                symbols.append(symbol)
+            return ''.join(reversed(symbols))
+
+        def differ(p, q):
+            return (p in this.final_states) != (q in other.final_states)
+
+        initial_state = (this.initial_state, other.initial_state)
+        if differ(*initial_state):
+            return ''
+
+        parent[find((0, this.initial_state))] = find((1, other.initial_state))
+        previous = {}
+        states = deque([initial_state])
+
+        while states:
+            state = states.popleft()
+            p, q = state
+
+            for symbol in alphabet:
+                new_state = (this._move(p, symbol), other._move(q, symbol))
+                a, b = find((0, new_state[0])), find((1, new_state[1]))
+                if a == b:
+                    continue
+
+                previous.setdefault(new_state, (state, symbol))
+                if differ(*new_state):
+                    return word(new_state)
+
+                parent[a] = b
+                states.append(new_state)
+
+        return None
+
+    @cached_property
+    def successors(self) -> Dict[State, Set[State]]:
+        successors = defaultdict(set)
+        for (src, _), dst in self.transitions.items():
+            successors[src].add(dst)
+        return dict(successors)
+
+    @cached_property
+    def predecessors(self) -> Dict[State, Set[State]]:
+        predecessors = defaultdict(set)
+        for (src, _), dst in self.transitions.items():
+            predecessors[dst].add(src)
+        return dict(predecessors)
+
+    def trim(self):
+        return self._trimmed
+
+    @cached_property
+    def _trimmed(self):
+        # only the states on a path from the initial state to a final one,
+        # the initial state itself aside. Missing transitions lead to ERROR,
+        # so when that is final, dead states must stay to keep words out.
+        useful = _closure(self.successors, {self.initial_state})
+        if self.ERROR in self.final_states:
+            useful.add(self.ERROR)
+        else:
+            useful &= _closure(self.predecessors, self.final_states & useful)
+            useful.add(self.initial_state)
+        if len(useful) == len(self.states):
+            return self
+
+        return DFA.create(
+            initial_state=self.initial_state,
+            transitions={
+                k: v for k, v in self.transitions.items()
+                if k[0] in useful and v in useful
+                },
+            final_states=self.final_states & useful,
+            alphabet=self.alphabet,
+            )
+
+    def remove_unreachable(self):
+        reachable = _closure(self.successors, {self.initial_state})
+
+        if self.ERROR in self.final_states:
+            reachable.add(self.ERROR)
 
         return self.create(
             initial_state=self.initial_state,
@@ -85,112 +299,285 @@ class DFA(NamedTuple):
                 k: v for k, v in self.transitions.items()
                 if k[0] in reachable and v in reachable
                 },
-            final_states={q for q in self.final_states if q in reachable}
+            final_states={q for q in self.final_states if q in reachable},
+            # unused symbols still matter to complements
+            alphabet=self.alphabet,
             )
 
     def merge_nondistinguishable(self):
-        classes = [self.final_states, self.states - self.final_states]
+        # Hopcroft's partition refinement: states are numbered, `block` maps
+        # each state to its class and `inverse` indexes transitions backwards
+        # so each split only touches predecessors of the splitter. Symbols of
+        # a class split alike, so one of each is enough.
+        alphabet = [klass[0] for klass in self.symbol_classes()]
+        names = sorted(self.states)
+        index = {q: i for i, q in enumerate(names)}
 
-        def equivalence_class(state) -> Set[State]:
-            for klass in classes:
-                if state in klass:
-                    return klass
+        # missing transitions go to ERROR, added as a virtual state unless
+        # it is a final one already. It is added even if no transition is
+        # missing, so that any materialized sink merges into it.
+        accepting = self.ERROR in self.final_states
+        virtual = not accepting
+        sink = index[self.ERROR] if accepting else len(names)
+        inverse = defaultdict(list)
+        for q, i in index.items():
+            for symbol in alphabet:
+                dst = self.transitions.get((q, symbol))
+                inverse[(sink if dst is None else index[dst], symbol)] \
+                    .append(i)
 
-        def equivalents(this, klass):
-            for that in klass:
-                if all(equivalence_class(self.step(this, symbol)) ==
-                               equivalence_class(self.step(that, symbol))
-                       for symbol in self.alphabet):
-                    yield that
+        if virtual:
+            for symbol in alphabet:
+                inverse[(sink, symbol)].append(sink)
 
-        while True:
-            new_classes = []
+        final = {index[q] for q in self.final_states}
+        nonfinal = set(range(len(names) + virtual)) - final
+        blocks = [klass for klass in (final, nonfinal) if klass]
+        block = [0] * (len(names) + virtual)
+        for i, klass in enumerate(blocks):
+            for q in klass:
+                block[q] = i
 
-            for klass in (s.copy() for s in classes):
-                if not klass:
-                    continue
+        smallest = min(range(len(blocks)), key=lambda i: len(blocks[i]))
+        pending = {(smallest, symbol) for symbol in alphabet}
 
-                first = next(q for q in klass)
+        while pending:
+            splitter, symbol = pending.pop()
 
-                equiv_states = frozenset([first, *equivalents(first, klass)])
-                new_classes.append(equiv_states)
-                if equiv_states != klass:
-                    new_classes.append(klass - equiv_states)
+            touched = defaultdict(set)
+            for q in blocks[splitter]:
+                for p in inverse[(q, symbol)]:
+                    touched[block[p]].add(p)
 
-            if classes == new_classes:
-                break
+            for i, inside in touched.items():
+                klass = blocks[i]
+                if len(inside) == len(klass):
+                    continue
+
+                # the touched states move to a new block, so splitting costs
+                # no more than finding them did
+                klass -= inside
+                j = len(blocks)
+                blocks.append(inside)
+                for q in inside:
+                    block[q] = j
 
-            classes = new_classes
+                # if (i, a) was pending, both halves now are; otherwise the
+                # smaller half is enough
+                for a in alphabet:
+                    if (i, a) in pending or len(inside) <= len(klass):
+                        pending.add((j, a))
+                    else:
+                        pending.add((i, a))
 
+        # states equivalent to ERROR are left implicit, along with the
+        # transitions into them
+        dead = block[sink]
+        initial = block[index[self.initial_state]]
         trans = {
-            frozenset(state): f'q{i}' for i, state in enumerate(classes)
+            i: f'q{n}' for n, i in enumerate(
+                i for i in range(len(blocks)) if i != dead or i == initial)
             }
+        if accepting:
+            trans[dead] = self.ERROR
 
-        def is_final(klass):
-            return any(state in self.final_states for state in klass)
+        def equivalence_class(state):
+            return trans.get(block[index[state]])
 
-        initial_state = next(c for c in classes if self.initial_state in c)
         return DFA.create(
-            initial_state=trans[initial_state],
+            initial_state=equivalence_class(self.initial_state),
             transitions={
-                (trans[equivalence_class(k[0])], k[1]):
-                    trans[equivalence_class(v)]
+                (equivalence_class(k[0]), k[1]): equivalence_class(v)
                 for k, v in self.transitions.items()
+                if block[index[v]] != dead
                 },
-            final_states={trans[c] for c in classes if is_final(c)},
+            final_states={equivalence_class(q) for q in self.final_states},
+            alphabet=self.alphabet,
             )
 
     def minimize(self):
         minimal = self.remove_unreachable().merge_nondistinguishable()
-        return minimal.rename().complete()
+        return minimal.rename()
 
     def accept(self, word) -> bool:
+        # stops as soon as the outcome is known: in a dead state, or in an
+        # absorbing one where only the alphabet matters anymore
+        dead, absorbing = self._settled
         state = self.initial_state
-        for symbol in word:
+        symbols = iter(word)
+        if state in dead:
+            return False
+        if state in absorbing:
+            return all(a in self.alphabet for a in symbols)
+
+        for symbol in symbols:
             state = self.step(state, symbol)
             if not state:
+                return self.ERROR in self.final_states and \
+                    symbol in self.alphabet and \
+                    all(a in self.alphabet for a in symbols)
+            if state in dead:
                 return False
+            if state in absorbing:
+                return all(a in self.alphabet for a in symbols)
         return state in self.final_states
 
+    @cached_property
+    def _settled(self) -> Tuple[FrozenSet[State], FrozenSet[State]]:
+        # the states that can't reach a final one, and the final ones that
+        # every symbol keeps among final ones. Missing transitions lead to
+        # ERROR, so when it is final, the states missing some lead there.
+        error = self.ERROR in self.final_states
+        degree = defaultdict(int)
+        for src, _ in self.transitions:
+            degree[src] += 1
+        partial = {q for q in self.states if degree[q] < len(self.alphabet)}
+
+        def sources(q):
+            yield from self.predecessors.get(q, ())
+            if error and q == self.ERROR:
+                yield from partial
+
+        live = _closure(self.predecessors, self.final_states |
+                        (partial if error else set()))
+
+        # anything leading out of the absorbing states takes its sources
+        # out as well
+        absorbing = set(self.final_states)
+        pending = list(self.states - absorbing)
+        if not error:
+            absorbing -= partial
+            pending.extend(self.final_states & partial)
+        while pending:
+            for p in sources(pending.pop()):
+                if p in absorbing:
+                    absorbing.remove(p)
+                    pending.append(p)
+
+        return frozenset(self.states - live), frozenset(absorbing)
+
     def step(self, state: State, symbol: Symbol) -> Optional[str]:
         return self.transitions.get((state, symbol))
 
+    def _move(self, state: State, symbol: Symbol) -> Optional[str]:
+        # like step, but follows the implicit transitions into a final ERROR
+        new_state = self.transitions.get((state, symbol))
+        if new_state is None and state is not None and \
+                self.ERROR in self.final_states and symbol in self.alphabet:
+            return self.ERROR
+        return new_state
+
+    def compile(self) -> 'CompiledDFA':
+        states = (self.initial_state,
+                  *sorted(self.states - {self.initial_state}))
+        index = {q: i for i, q in enumerate(states)}
+        classes = self.symbol_classes()
+        symbols = {a: i for i, klass in enumerate(classes) for a in klass}
+
+        # a final ERROR gets a row of its own, other missing transitions
+        # reject right away
+        error = index.get(self.ERROR, -1) \
+            if self.ERROR in self.final_states else -1
+        table = array('i', [error]) * (len(states) * len(classes))
+        for i, state in enumerate(states):
+            for j, klass in enumerate(classes):
+                dst = self.transitions.get((state, klass[0]))
+                if dst is not None:
+                    table[i * len(classes) + j] = index[dst]
+
+        final_states = frozenset(index[q] for q in self.final_states)
+        absorbing = _prune(table, len(states), len(classes), final_states)
+
+        return CompiledDFA(
+            states=states,
+            symbols=symbols,
+            classes=classes,
+            initial_state=0,
+            table=table,
+            final_states=final_states,
+            absorbing=absorbing,
+            )
+
+    def accept_many(self, words) -> np.ndarray:
+        return self.compile().accept_many(words)
+
+    def symbol_classes(self) -> Tuple[Tuple[Symbol, ...], ...]:
+        # symbols with the same column of transitions can't be told apart,
+        # ordered by their smallest symbol
+        states = sorted(self.states)
+        classes = defaultdict(list)
+        for symbol in sorted(self.alphabet):
+            column = tuple(self.transitions.get((q, symbol)) for q in states)
+            classes[column].append(symbol)
+        return tuple(map(tuple, classes.values()))
+
+    def matcher(self) -> 'Matcher':
+        return self.compile().matcher()
+
+    def searcher(self):
+        from search import Searcher  # fucking circular import
+
+        return Searcher.create(self)
+
+    def finditer(self, text):
+        return self.searcher().finditer(text)
+
+    def search(self, text):
+        return self.searcher().search(text)
+
+    def reverse(self):
+        return self.to_nfa().reverse()
+
     def rename(self):
         import string
-        trans, counter = {}, 0
-        states = [self.initial_state]
 
-        alphabet = sorted(self.alphabet)
-        while states:
-            state = states.pop(0)
+        def name(counter):
+            # A, ..., Z, AA, AB, ... so large automata don't run out of names
+            name = ''
+            while True:
+                counter, digit = divmod(counter, 26)
+                name = string.ascii_uppercase[digit] + name
+                if not counter:
+                    return name
+                counter -= 1
 
-            trans[state] = f'{string.ascii_uppercase[counter]}'
-            counter += 1
+        names = map(name, itertools.count())
+        trans = {self.ERROR: self.ERROR}
+        trans.setdefault(self.initial_state, next(names))
+        states = deque([self.initial_state])
+
+        alphabet = [klass[0] for klass in self.symbol_classes()]
+        while states:
+            state = states.popleft()
 
             for symbol in alphabet:
                 step = self.step(state, symbol)
                 if step and step not in trans:
+                    trans[step] = next(names)
                     states.append(step)
 
         return DFA.create(
-            initial_state='A',
+            initial_state=trans[self.initial_state],
             transitions={
                 (trans[k[0]], k[1]): trans[v]
                 for k, v in self.transitions.items()
                 },
             final_states={trans[q] for q in self.final_states},
+            alphabet=self.alphabet,
             )
 
-
     def to_dfa(self):
         return self
 
     def to_nfa(self):
         from nfa import NFA  # fucking circular import
+
+        # NFAs have no implicit transitions to spell a final ERROR with
+        dfa = self.complete() if self.ERROR in self.final_states else self
         return NFA.create(
-            self.initial_state, {
-                k: [v] for k, v in self.transitions.items()
-                }, self.final_states
+            dfa.initial_state, {
+                k: [v] for k, v in dfa.transitions.items()
+                }, dfa.final_states
             )
 
     def to_dot(self) -> graphviz.Digraph:  # pragma: no cover
@@ -213,8 +600,9 @@ class DFA(NamedTuple):
         return f
 
     @classmethod
-    def create(cls, initial_state, transitions, final_states):
-        alphabet = {s for _, s in transitions}
+    def create(cls, initial_state, transitions, final_states, alphabet=()):
+        # symbols without transitions still matter, they lead to ERROR
+        alphabet = {s for _, s in transitions} | set(alphabet)
 
         s = chain.from_iterable((k[0], v) for k, v in transitions.items())
         states = {initial_state} | set(final_states) | set(s)
@@ -228,13 +616,426 @@ class DFA(NamedTuple):
             )
 
 
+def _closure(edges: Dict[State, Set[State]], states) -> Set[State]:
+    # everything reachable from `states` along `edges`, themselves included
+    seen, pending = set(states), list(states)
+    while pending:
+        for q in edges.get(pending.pop(), ()):
+            if q not in seen:
+                seen.add(q)
+                pending.append(q)
+    return seen
+
+
+def _count(dfa: 'CompiledDFA', n: int, upto=False) -> int:
+    # walks of n steps from the initial state to a final one, each step
+    # weighted by the number of symbols taking it. For words up to n long,
+    # final states also step into an extra state that loops on itself, and
+    # walks take one more step to end there.
+    if n < 0:
+        raise ValueError(f'negative word length: {n}')
+
+    size, width = len(dfa.states), len(dfa.classes)
+    table = np.asarray(dfa.table, dtype=np.intp).reshape(size, width)
+    sources, columns = np.nonzero(table >= 0)
+    targets = table[sources, columns]
+    weights = np.array([len(klass) for klass in dfa.classes],
+                       dtype=np.int64)[columns]
+
+    final_states = sorted(dfa.final_states)
+    steps, ends = n, final_states
+    if upto:
+        sources = np.append(sources, [*final_states, size])
+        targets = np.append(targets, [size] * (len(final_states) + 1))
+        weights = np.append(weights, [1] * (len(final_states) + 1))
+        size, steps, ends = size + 1, n + 1, [size]
+
+    # counts never exceed the largest out-degree to the power of the steps;
+    # past 63 bits, they are Python integers
+    degree = np.bincount(sources, weights, minlength=size).max(initial=1)
+    dtype = np.int64 if steps * math.log2(max(degree, 1)) < 63 else object
+    weights = weights.astype(dtype)
+
+    vector = np.zeros(size, dtype=dtype)
+    vector[dfa.initial_state] = 1
+    if size <= _DENSE_STATES and \
+            size ** 3 * steps.bit_length() < steps * len(sources):
+        # repeated squaring of the adjacency matrix, once it is cheaper
+        matrix = np.zeros((size, size), dtype=dtype)
+        np.add.at(matrix, (sources, targets), weights)
+        while steps:
+            if steps & 1:
+                vector = vector @ matrix
+            steps >>= 1
+            if steps:
+                matrix = matrix @ matrix
+    else:
+        for _ in range(steps):
+            new_vector = np.zeros(size, dtype=dtype)
+            np.add.at(new_vector, targets, vector[sources] * weights)
+            vector = new_vector
+
+    return int(vector[ends].sum())
+
+
+def _longest(dfa: 'CompiledDFA') -> Optional[int]:
+    # length of the longest word accepted, -1 if there is none, or None if
+    # a cycle can be reached; all transitions lead to live states, so any
+    # such cycle pumps accepted words
+    width, table = len(dfa.classes), dfa.table
+
+    def successors(q):
+        return {r for r in table[q * width:(q + 1) * width] if r >= 0}
+
+    longest, path = {}, {dfa.initial_state}
+    stack = [(dfa.initial_state, iter(successors(dfa.initial_state)))]
+    while stack:
+        q, rest = stack[-1]
+        for r in rest:
+            if r in path:
+                return None
+            if r not in longest:
+                path.add(r)
+                stack.append((r, iter(successors(r))))
+                break
+        else:
+            stack.pop()
+            path.discard(q)
+            lengths = [longest[r] + 1 for r in successors(q)
+                       if longest[r] >= 0]
+            if q in dfa.final_states:
+                lengths.append(0)
+            longest[q] = max(lengths, default=-1)
+
+    return longest[dfa.initial_state]
+
+
+def _pairs(this: 'CompiledDFA', that: 'CompiledDFA', accept):
+    # runs both automata side by side breadth-first, yielding every edge
+    # between reachable pairs of state ids along with the symbols taking it.
+    # -1 stands for the error state of a missing transition, and pairs that
+    # can't become final under `accept` anymore are not visited.
+    columns = defaultdict(list)
+    for a in sorted(this.symbols.keys() | that.symbols.keys()):
+        columns[this.symbols.get(a, -1), that.symbols.get(a, -1)].append(a)
+    columns = [(tuple(symbols), a, b) for (a, b), symbols in columns.items()]
+    this_width, that_width = len(this.classes), len(that.classes)
+
+    def alive(p, q):
+        if p < 0:
+            return accept(False, False) or accept(False, True)
+        if q < 0:
+            return accept(False, False) or accept(True, False)
+        return True
+
+    initial_state = (this.initial_state, that.initial_state)
+    seen = {initial_state}
+    states = deque([initial_state])
+
+    while states:
+        state = states.popleft()
+        p, q = state
+
+        for symbols, a, b in columns:
+            new_state = (
+                this.table[p * this_width + a] if p >= 0 and a >= 0 else -1,
+                that.table[q * that_width + b] if q >= 0 and b >= 0 else -1,
+                )
+            if new_state == (-1, -1) or not alive(*new_state):
+                continue
+
+            if new_state not in seen:
+                seen.add(new_state)
+                states.append(new_state)
+
+            yield state, symbols, new_state
+
+
+def _prune(table: array, states: int, width: int, final_states):
+    # transitions into states that can't reach a final one are dropped from
+    # the table, so runs stop as soon as they would enter them. Returns the
+    # states accepting any word over the alphabet: final ones with all
+    # transitions defined, leading to such states only.
+    predecessors = [[] for _ in range(states)]
+    for i, q in enumerate(table):
+        if q >= 0:
+            predecessors[q].append(i // width)
+
+    live, pending = set(final_states), list(final_states)
+    while pending:
+        for p in predecessors[pending.pop()]:
+            if p not in live:
+                live.add(p)
+                pending.append(p)
+
+    for i, q in enumerate(table):
+        if q >= 0 and q not in live:
+            table[i] = -1
+
+    # anything leading out of the absorbing states takes its predecessors
+    # out as well
+    absorbing = set(final_states)
+    pending = [q for q in range(states) if q not in absorbing]
+    for q in final_states:
+        if any(table[q * width + a] < 0 for a in range(width)):
+            absorbing.remove(q)
+            pending.append(q)
+    while pending:
+        for p in predecessors[pending.pop()]:
+            if p in absorbing:
+                absorbing.remove(p)
+                pending.append(p)
+
+    return frozenset(absorbing)
+
+
+class CompiledDFA(NamedTuple):
+    # states and symbol classes are numbered, `symbols` maps each symbol to
+    # its class and the transition from state `q` on class `a` lives at
+    # `table[q * len(classes) + a]`, -1 meaning none
+    states: Tuple[State, ...]
+    symbols: Dict[Symbol, int]
+    classes: Tuple[Tuple[Symbol, ...], ...]
+    initial_state: int
+    table: array
+    final_states: FrozenSet[int]
+    # states accepting whatever follows, as long as it is in the alphabet
+    absorbing: FrozenSet[int] = frozenset()
+
+    def accept(self, word) -> bool:
+        table, symbols, width = self.table, self.symbols, len(self.classes)
+        absorbing = self.absorbing
+        state = self.initial_state
+        symbols_left = iter(word)
+        if state in absorbing:
+            return all(map(symbols.__contains__, symbols_left))
+
+        for symbol in symbols_left:
+            index = symbols.get(symbol)
+            if index is None:
+                return False
+            state = table[state * width + index]
+            if state < 0:
+                return False
+            if absorbing and state in absorbing:
+                return all(map(symbols.__contains__, symbols_left))
+        return state in self.final_states
+
+    def accept_many(self, words) -> np.ndarray:
+        # the extra last entry is for the error state
+        accepting = np.zeros(len(self.states) + 1, dtype=bool)
+        accepting[list(self.final_states)] = True
+        return accepting[self.run_many(words, absorb=True)]
+
+    def run_many(self, words, absorb=False) -> np.ndarray:
+        # the state each word ends in, -1 if it fell into the error state;
+        # with `absorb`, words reaching an absorbing state stop there.
+        # An extra error state and an extra "unknown symbol" column make
+        # every lookup valid; rows are stored pre-multiplied by the row width
+        # so a step is a single flat `take`
+        error, width = len(self.states), len(self.classes) + 1
+        table = np.full((error + 1, width), error, dtype=np.intp)
+        table[:error, :-1] = np.asarray(
+            self.table, dtype=np.intp).reshape(error, width - 1)
+        table[table < 0] = error
+
+        # the batch is done once every word is in a state it won't leave
+        stopped = np.zeros(error + 1, dtype=bool)
+        stopped[error] = True
+        if absorb and self.absorbing:
+            absorbing = list(self.absorbing)
+            table[absorbing, :-1] = np.array(absorbing)[:, None]
+            stopped[absorbing] = True
+        table = (table * width).ravel()
+
+        # words are run in buckets of lengths within a factor of two, so
+        # padding them to the longest of their bucket at most doubles the
+        # work, whatever outliers the batch has
+        words = list(words)
+        lengths = np.fromiter(map(len, words), dtype=np.intp, count=len(words))
+        buckets = np.frexp(lengths)[1]
+        result = np.empty(len(words), dtype=np.intp)
+        for bucket in np.unique(buckets):
+            index = np.flatnonzero(buckets == bucket)
+            result[index] = self._run_bucket(
+                table, stopped, [words[i] for i in index], lengths[index])
+        return result
+
+    def _run_bucket(self, table, stopped, words, lengths) -> np.ndarray:
+        error, width = len(self.states), len(self.classes) + 1
+        longest = int(lengths.max(initial=0))
+
+        # longest words first, so the words still running at column `i` are
+        # always a prefix of the batch
+        order = np.argsort(-lengths, kind='stable')
+        running = len(words) - np.cumsum(np.bincount(lengths,
+                                                     minlength=longest))
+        codes = self._encode(words, longest)[:, order]
+
+        states = np.full(len(words), self.initial_state * width, dtype=np.intp)
+        for i in range(longest):
+            n = running[i]
+            if i % 16 == 0 and stopped.take(states[:n] // width).all():
+                # what is left only matters if it leaves the alphabet
+                left = np.arange(i, longest)[:, None] < lengths[order[:n]]
+                unknown = ((codes[i:, :n] == width - 1) & left).any(axis=0)
+                states[:n][unknown] = error * width
+                break
+            states[:n] = table.take(states[:n] + codes[i, :n])
+
+        states //= width
+        states[states == error] = -1
+        result = np.empty(len(words), dtype=np.intp)
+        result[order] = states
+        return result
+
+    def _encode(self, words, longest) -> np.ndarray:
+        # class indices, one row per column of the batch
+        symbols, unknown = self.symbols, len(self.classes)
+        dtype = np.min_scalar_type(unknown)
+
+        try:
+            points = np.array(words) if words else None
+        except ValueError:
+            points = None
+
+        if points is not None and points.dtype.kind == 'U' and \
+                points.ndim == 1 and all(len(a) == 1 for a in symbols):
+            # plain strings: map code points through a lookup array
+            points = points.view(np.uint32).reshape(len(words), -1)
+            lookup = np.full(max(map(ord, symbols), default=0) + 2, unknown,
+                             dtype=dtype)
+            for a, i in symbols.items():
+                lookup[ord(a)] = i
+            points = np.minimum(points[:, :longest].T, len(lookup) - 1)
+            return lookup.take(points)
+
+        codes = np.full((longest, len(words)), unknown, dtype=dtype)
+        for column, word in enumerate(words):
+            codes[:len(word), column] = [symbols.get(a, unknown) for a in word]
+        return codes
+
+    def step(self, state: int, symbol: Symbol) -> int:
+        index = self.symbols.get(symbol)
+        if index is None or state < 0:
+            return -1
+        return self.table[state * len(self.classes) + index]
+
+    def compile(self) -> 'CompiledDFA':
+        return self
+
+    def to_dfa(self) -> DFA:
+        width = len(self.classes)
+        final_states = {self.states[q] for q in self.final_states}
+
+        # -1 rejects, but a missing transition would lead to ERROR; when that
+        # is final, -1 becomes a non-final sink, last so that it is states[-1]
+        states, transitions = self.states, {}
+        rejecting = DFA.ERROR in final_states
+        if rejecting:
+            sink = DFA.ERROR * 2
+            while sink in states:
+                sink += DFA.ERROR
+            states += (sink,)
+            transitions = {(sink, a): sink for a in self.symbols}
+
+        transitions.update({
+            (states[i // width], a): states[q]
+            for i, q in enumerate(self.table) if q >= 0 or rejecting
+            for a in self.classes[i % width]
+            })
+
+        return DFA.create(
+            initial_state=states[self.initial_state],
+            transitions=transitions,
+            final_states=final_states,
+            alphabet=self.symbols,
+            )
+
+    def matcher(self) -> 'Matcher':
+        return Matcher(self)
+
+
+class Matcher:
+    # incremental run of a compiled DFA over a word given in chunks; bytes
+    # are read as latin-1 characters
+    __slots__ = ('dfa', 'state', '_bytes')
+
+    def __init__(self, dfa: CompiledDFA):
+        self.dfa = dfa
+        self.state = dfa.initial_state
+        self._bytes = [dfa.symbols.get(chr(b), -1) for b in range(256)]
+
+    @property
+    def accepting(self) -> bool:
+        return self.state in self.dfa.final_states
+
+    @property
+    def settled(self) -> bool:
+        # whether no more bytes can change the outcome
+        return self.state < 0 or \
+            self.state in self.dfa.absorbing and -1 not in self._bytes
+
+    def feed(self, chunk) -> 'Matcher':
+        table, width = self.dfa.table, len(self.dfa.classes)
+        absorbing = self.dfa.absorbing
+        state = self.state
+        if state < 0:
+            return self
+
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            lookup = self._bytes
+            if state in absorbing and -1 not in lookup:
+                return self
+            indices = (lookup[b] for b in memoryview(chunk).cast('B'))
+        else:
+            symbols = self.dfa.symbols
+            indices = (symbols.get(a, -1) for a in chunk)
+
+        if state not in absorbing:
+            for index in indices:
+                if index < 0:
+                    state = -1
+                    break
+                state = table[state * width + index]
+                if state < 0 or absorbing and state in absorbing:
+                    break
+
+        # once absorbed, only symbols outside the alphabet matter
+        if state in absorbing and any(index < 0 for index in indices):
+            state = -1
+
+        self.state = state
+        return self
+
+
+def scan_file(dfa, path, chunk_size=1 << 20) -> Matcher:
+    # feeds a memory-mapped file through a matcher, one slice at a time
+    matcher = dfa.compile().matcher()
+    with open(path, 'rb') as fp:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return matcher
+
+        with data, memoryview(data) as view:
+            for offset in range(0, len(view), chunk_size):
+                with view[offset:offset + chunk_size] as chunk:
+                    matcher.feed(chunk)
+                if matcher.settled:
+                    break
+
+    return matcher
+
+
 def load_dfa(fp) -> DFA:
     raw = json.load(fp=fp)
 
     return DFA.create(
         initial_state=raw['initial_state'],
         transitions={(t[0], t[1]): t[2] for t in raw['transitions']},
-        final_states=set(raw['final_states'])
+        final_states=set(raw['final_states']),
+        alphabet=raw.get('alphabet', ()),
         )
 
 
@@ -243,4 +1044,5 @@ def dump_dfa(fp, dfa: DFA):
         'initial_state': dfa.initial_state,
         'transitions': [[k[0], k[1], v] for k, v in dfa.transitions.items()],
         'final_states': list(dfa.final_states),
+        'alphabet': sorted(dfa.alphabet),
         })
@@ -29,7 +29,7 @@ class AutomataTab(TabbedPanelItem):
 
 def with_symbol(automata, symbol):
     '''Generates an automata based on another, but with a new given symbol.'''
-    transitions = automata.transitions
+    transitions = dict(automata.transitions)
     for state in automata.states:
         transitions[(state, symbol)] = {'-'}
     return automata.create(automata.initial_state,
@@ -38,7 +38,7 @@ def with_symbol(automata, symbol):
 
 def with_state(automata, state):
     '''Generates an automata based on another, but with a new given state.'''
-    transitions = automata.transitions
+    transitions = dict(automata.transitions)
     for symbol in automata.alphabet:
         transitions[(state, symbol)] = {'-'}
     return automata.create(automata.initial_state,
@@ -176,8 +176,14 @@ class MainWindow(Widget):
     def update_transition(self, transition, content, spinner):
         '''Updates transition with new content's value.'''
         print(f'updating {transition} to {content.value}')
+        # automata cache indexes over their transitions, so never edit one in
+        # place
         automata = self.current_automata()
-        automata.transitions[transition] = {content.value}
+        transitions = dict(automata.transitions)
+        transitions[transition] = {content.value}
+        self.current_tab().automata = automata.create(automata.initial_state,
+                                                      transitions,
+                                                      automata.final_states)
         self.remake_table()
         self.dismiss_popup()
 
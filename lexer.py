@@ -0,0 +1,64 @@
+from array import array
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+from dfa import CompiledDFA
+from patterns import PatternSet
+
+Token = Tuple[str, int, int]
+
+
+class Lexer(NamedTuple):
+    # splits text into the longest tokens it can, trying every token type at
+    # once on the product of their automata; `tokens[q]` is the type state
+    # `q` accepts, the first listed winning ties, or -1 for none
+    types: Tuple[str, ...]
+    dfa: CompiledDFA
+    tokens: array
+    # columns of each byte value, for bytes-like input read as latin-1
+    byte_columns: Tuple[Optional[int], ...]
+
+    @classmethod
+    def create(cls, tokens):
+        # tokens are (token type, automaton) pairs, most important first
+        tokens = list(tokens)
+        patterns = PatternSet.create(automaton for _, automaton in tokens)
+        symbols = patterns.dfa.symbols
+
+        return cls(
+            types=tuple(token_type for token_type, _ in tokens),
+            dfa=patterns.dfa,
+            tokens=array('i', (min(tag, default=-1) for tag in patterns.tags)),
+            byte_columns=tuple(symbols.get(chr(b)) for b in range(256)),
+            )
+
+    def tokenize(self, text) -> Iterator[Token]:
+        # yields (token type, start, end) as it goes; the automaton runs
+        # until it reaches the error state or the end of the text, and the
+        # last token it accepted on the way is the one taken
+        dfa, tokens, types = self.dfa, self.tokens, self.types
+        table, width = dfa.table, len(dfa.classes)
+
+        if isinstance(text, (bytes, bytearray, memoryview)):
+            text = memoryview(text).cast('B')
+            column = self.byte_columns.__getitem__
+        else:
+            column = dfa.symbols.get
+
+        start, length = 0, len(text)
+        while start < length:
+            state, token, end = dfa.initial_state, -1, start
+            for i in range(start, length):
+                index = column(text[i])
+                if index is None:
+                    break
+                state = table[state * width + index]
+                if state < 0:
+                    break
+                if tokens[state] >= 0:
+                    token, end = tokens[state], i + 1
+
+            if token < 0:
+                raise ValueError(f'no token matches at position {start}')
+
+            yield types[token], start, end
+            start = end
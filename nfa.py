@@ -1,9 +1,11 @@
 import copy
 import itertools
 import json
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
+from functools import cached_property
 from itertools import chain
-from typing import DefaultDict, FrozenSet, NamedTuple, Tuple
+from typing import (DefaultDict, Dict, FrozenSet, NamedTuple, Optional, Set,
+                    Tuple)
 
 import graphviz
 
@@ -16,15 +18,18 @@ def shrink(transitions):
     return {k: v for k, v in transitions.items() if v}
 
 
-class NFA(NamedTuple):
-    EPSILON = '&'
-
+class _NFA(NamedTuple):
     alphabet: FrozenSet[Symbol]
     states: StateSet
     initial_state: State
     transitions: DefaultDict[Tuple[Symbol, State], StateSet]
     final_states: StateSet
 
+
+class NFA(_NFA):
+    # not a NamedTuple itself so instances get a __dict__ for cached indexes
+    EPSILON = '&'
+
     def __invert__(self):
         return self.complement()
 
@@ -40,25 +45,21 @@ class NFA(NamedTuple):
         return self.concatenate(other)
 
     def concatenate(self, other):
-        new_transitions = {
-            (f'{q}_0', self.EPSILON): {f'{other.initial_state}_1'}
-            for q in self.final_states
-            }
+        left, right = self.trim(), other.to_nfa().trim()
+        this, that = left._numbered(), right._numbered(len(left.states))
 
-        new_transitions.update({
-            (f'{src}_0', symbol): {f'{state}_0' for state in dst}
-            for (src, symbol), dst in self.transitions.items()
-            })
+        new_transitions = left._renamed(this)
+        for key, dst in right._renamed(that).items():
+            new_transitions[key] |= dst
 
-        new_transitions.update({
-            (f'{src}_1', symbol): {f'{state}_1' for state in dst}
-            for (src, symbol), dst in other.transitions.items()
-            })
+        for q in left.final_states:
+            new_transitions[(this[q], self.EPSILON)].add(
+                that[right.initial_state])
 
         return NFA.create(
-            initial_state=f'{self.initial_state}_0',
+            initial_state=this[left.initial_state],
             transitions=new_transitions,
-            final_states={f'{state}_1' for state in other.final_states},
+            final_states={that[state] for state in right.final_states},
             )
 
     def __sub__(self, other):
@@ -71,30 +72,57 @@ class NFA(NamedTuple):
         return self.union(other)
 
     def union(self, other):
-        other = other.to_nfa()
+        left, right = self.trim(), other.to_nfa().trim()
+        this = left._numbered(1)
+        that = right._numbered(1 + len(left.states))
 
-        new_transitions = {
-            ('q0', self.EPSILON): {f'{self.initial_state}_0',
-                                   f'{other.initial_state}_1', }
+        new_transitions = left._renamed(this)
+        for key, dst in right._renamed(that).items():
+            new_transitions[key] |= dst
+
+        new_transitions[('q0', self.EPSILON)] = {
+            this[left.initial_state], that[right.initial_state],
             }
 
-        new_transitions.update({
-            (f'{src}_0', a): {f'{state}_0' for state in dst}
-            for (src, a), dst in self.transitions.items()
-            })
+        return NFA.create(
+            initial_state='q0',
+            transitions=new_transitions,
+            final_states={this[state] for state in left.final_states} |
+                         {that[state] for state in right.final_states}
+            )
 
-        new_transitions.update({
-            (f'{src}_1', a): {f'{state}_1' for state in dst}
-            for (src, a), dst in other.transitions.items()
-            })
+    def reverse(self):
+        # every transition flipped, entering through the old final states
+        names = self._numbered(1)
+
+        new_transitions = defaultdict(set)
+        for (src, symbol), dst in self.transitions.items():
+            for q in dst:
+                new_transitions[(names[q], symbol)].add(names[src])
+
+        new_transitions[('q0', self.EPSILON)] = {
+            names[q] for q in self.final_states
+            }
 
         return NFA.create(
             initial_state='q0',
             transitions=new_transitions,
-            final_states={f'{state}_0' for state in self.final_states} |
-                         {f'{state}_1' for state in other.final_states}
+            final_states={names[self.initial_state]},
             )
 
+    def _numbered(self, start=0) -> Dict[State, State]:
+        # fresh names for combining automata, so they don't grow with every
+        # operation; the initial state comes first
+        states = (self.initial_state,
+                  *sorted(self.states - {self.initial_state}))
+        return {q: f'q{i}' for i, q in enumerate(states, start)}
+
+    def _renamed(self, names) -> DefaultDict[Tuple[State, Symbol], Set[State]]:
+        transitions = defaultdict(set)
+        for (src, symbol), dst in self.transitions.items():
+            transitions[(names[src], symbol)] |= {names[q] for q in dst}
+        return transitions
+
     def complete(self):
         qerr = frozenset({'-'})
 
@@ -131,15 +159,107 @@ class NFA(NamedTuple):
             frozenset(final_states),
             )
 
-    def epsilon_closure(self, state: State) -> StateSet:
-        closure, new_closure = {state, }, set()
+    @cached_property
+    def closures(self) -> Dict[State, StateSet]:
+        # Tarjan's SCC algorithm over epsilon edges; components come out
+        # successors first, so a closure is its component plus the closures
+        # of the components it points to
+        edges = {
+            q: self.transitions.get((q, self.EPSILON), frozenset())
+            for q in self.states
+            }
+        index, low, stack, on_stack = {}, {}, [], set()
+        closures = {}
+
+        def visit(q):
+            index[q] = low[q] = len(index)
+            stack.append(q)
+            on_stack.add(q)
+            return q, iter(edges[q])
+
+        for root in self.states:
+            if root in index:
+                continue
+
+            work = [visit(root)]
+            while work:
+                q, successors = work[-1]
+                for r in successors:
+                    if r not in index:
+                        work.append(visit(r))
+                        break
+                    if r in on_stack:
+                        low[q] = min(low[q], index[r])
+                else:
+                    work.pop()
+                    if work:
+                        p = work[-1][0]
+                        low[p] = min(low[p], low[q])
+
+                    if low[q] != index[q]:
+                        continue
+
+                    component = set()
+                    while q not in component:
+                        r = stack.pop()
+                        on_stack.discard(r)
+                        component.add(r)
+
+                    closure = set(component)
+                    for r in component:
+                        for s in edges[r]:
+                            if s not in component:
+                                closure |= closures[s]
+
+                    closure = frozenset(closure)
+                    for r in component:
+                        closures[r] = closure
+
+        return closures
+
+    @cached_property
+    def successors(self) -> Dict[State, Set[State]]:
+        successors = defaultdict(set)
+        for (src, _), dst in self.transitions.items():
+            successors[src] |= dst
+        return dict(successors)
+
+    @cached_property
+    def predecessors(self) -> Dict[State, Set[State]]:
+        predecessors = defaultdict(set)
+        for (src, _), dst in self.transitions.items():
+            for q in dst:
+                predecessors[q].add(src)
+        return dict(predecessors)
+
+    def trim(self):
+        return self._trimmed
 
-        while closure != new_closure:
-            new_closure = closure.copy()
-            for state in new_closure:
-                closure |= self.transitions[(state, self.EPSILON)]
+    @cached_property
+    def _trimmed(self):
+        # only the states on a path from the initial state to a final one,
+        # the initial state itself aside
+        from dfa import _closure  # fucking circular import
 
-        return frozenset(closure)
+        reachable = _closure(self.successors, {self.initial_state})
+        useful = reachable & _closure(
+            self.predecessors, self.final_states & reachable)
+        useful.add(self.initial_state)
+        if len(useful) == len(self.states):
+            return self
+
+        return NFA.create(
+            initial_state=self.initial_state,
+            transitions={
+                k: v & useful for k, v in self.transitions.items()
+                if k[0] in useful
+                },
+            final_states=set(self.final_states & useful),
+            )
+
+    def epsilon_closure(self, state: State) -> StateSet:
+        closure = self.closures.get(state)
+        return frozenset({state}) if closure is None else closure
 
     def remove_epsilon_transitions(self):
         transitions = copy.deepcopy(self.transitions)
@@ -164,69 +284,239 @@ class NFA(NamedTuple):
             )
 
     def accept(self, word) -> bool:
-        state = {self.initial_state}
-        for symbol in word:
-            state = self.step(state, symbol)
-            if not state:
-                return False
-        return any(q in self.final_states for q in state)
+        return self._lazy.accept(word)
+
+    def lazy(self, max_states=10000) -> 'LazyDFA':
+        return LazyDFA(self, max_states)
+
+    @cached_property
+    def _lazy(self) -> 'LazyDFA':
+        # shared by every call to accept, so subsets seen once stay known
+        return self.lazy()
+
+    def searcher(self):
+        from search import Searcher  # fucking circular import
+
+        return Searcher.create(self)
+
+    def finditer(self, text):
+        return self.searcher().finditer(text)
+
+    def search(self, text):
+        return self.searcher().search(text)
+
+    def compile(self) -> 'CompiledNFA':
+        return self._compiled
+
+    @cached_property
+    def _compiled(self) -> 'CompiledNFA':
+        from dfa import _closure  # fucking circular import
+
+        states = (self.initial_state,
+                  *sorted(self.states - {self.initial_state}))
+        index = {q: i for i, q in enumerate(states)}
+
+        # symbols moving every state alike share a class, and a row of
+        # targets; classes are ordered by their smallest symbol
+        columns = defaultdict(list)
+        for symbol in sorted(self.alphabet):
+            column = tuple(
+                frozenset(self.transitions.get((q, symbol), ()))
+                for q in states
+                )
+            columns[column].append(symbol)
+        classes = tuple(map(tuple, columns.values()))
+        symbols = {a: i for i, klass in enumerate(classes) for a in klass}
+
+        def mask(states):
+            result = 0
+            for q in states:
+                result |= 1 << index[q]
+            return result
+
+        # states that can't reach a final one are left out of every subset,
+        # so runs die as soon as nothing else is left
+        live = mask(_closure(self.predecessors, self.final_states))
+
+        closures = [mask(self.epsilon_closure(q)) & live for q in states]
+        targets = []
+        for column in columns:
+            direct = [0] * len(states)
+            for i, dst in enumerate(column):
+                for t in dst:
+                    direct[i] |= closures[index[t]]
+
+            row = []
+            for q in states:
+                result = 0
+                for p in self.epsilon_closure(q):
+                    result |= direct[index[p]]
+                row.append(result)
+            targets.append(tuple(row))
+
+        return CompiledNFA(
+            states=states,
+            symbols=symbols,
+            classes=classes,
+            initial_state=closures[0],
+            targets=tuple(targets),
+            final_states=mask(self.final_states),
+            chunks=tuple({} for _ in targets),
+            )
 
     def step(self, states: StateSet, symbol: Symbol) -> StateSet:
-        def reachable():
-            for closure in chain(self.epsilon_closure(s) for s in states):
-                for s in closure:
-                    for t in self.transitions.get((s, symbol), set()):
-                        for u in self.epsilon_closure(t):
-                            yield u
+        sources = frozenset().union(*map(self.epsilon_closure, states))
+        targets = set()
+        for s in sources:
+            for t in self.transitions.get((s, symbol), ()):
+                if t not in targets:
+                    targets |= self.epsilon_closure(t)
 
-        return frozenset(reachable())
+        return frozenset(targets)
 
     def to_dfa(self):
         from dfa import DFA  # fucking circular import
 
-        cleaned = self.remove_epsilon_transitions()
+        for transitions, final_states in self._determinize():
+            pass
 
-        transitions = {}
-        initial_state = frozenset({cleaned.initial_state, })
-        states = {initial_state, }
-        visited = set()
+        return DFA.create(
+            initial_state='q0',
+            transitions=transitions,
+            final_states=final_states,
+            alphabet=self.alphabet,
+            )
 
-        def is_final(s):
-            return any(q in cleaned.final_states for q in s)
+    def to_dfa_steps(self):
+        from dfa import DFA  # fucking circular import
 
-        steps = []
+        for transitions, final_states in self._determinize():
+            yield DFA.create(
+                initial_state='q0',
+                transitions=dict(transitions),
+                final_states=set(final_states),
+                alphabet=self.alphabet,
+                )
+
+    def _determinize(self):
+        # subset construction over bitmasks: each subset is interned to an
+        # id on discovery and expanded in FIFO order, so numbering is stable;
+        # yields the transitions and final states found after each expansion
+        compiled = self.compile()
+
+        initial_state = compiled.initial_state
+        ids = {initial_state: 0}
+        states = deque([initial_state])
+        transitions = {}
+        final_states = {'q0'} if initial_state & compiled.final_states \
+            else set()
 
         while states:
-            state = states.pop()
-            visited.add(state)
+            state = states.popleft()
 
-            for symbol in cleaned.alphabet:
-                new_state = cleaned.step(state, symbol)
+            for index, klass in enumerate(compiled.classes):
+                new_state = compiled.move(state, index)
                 if not new_state:
                     continue
 
-                transitions[(state, symbol)] = new_state
-
-                if new_state not in visited:
-                    states.add(new_state)
-
-            steps.append(DFA.create(
-                initial_state=initial_state,
-                transitions=transitions,
-                final_states={state for state in visited if is_final(state)},
-                ))
-
-        trans = {
-            state: f'q{i}' for i, state in zip(range(len(visited)), visited)
-            }
+                if new_state not in ids:
+                    ids[new_state] = len(ids)
+                    states.append(new_state)
+                    if new_state & compiled.final_states:
+                        final_states.add(f'q{ids[new_state]}')
+
+                for symbol in klass:
+                    transitions[(f'q{ids[state]}', symbol)] = \
+                        f'q{ids[new_state]}'
+
+            yield transitions, final_states
+
+    def includes(self, other) -> bool:
+        return self.inclusion_counterexample(other) is None
+
+    def is_universal(self) -> bool:
+        return self.inclusion_counterexample() is None
+
+    def inclusion_counterexample(self, other=None) -> Optional[str]:
+        # a word accepted by `other` (by default, any word over this
+        # alphabet) but not by this automaton, or None.
+        #
+        # Antichain algorithm: runs each state of `other` against the subset
+        # this automaton could be in, on the fly. A pair is dropped when a
+        # pair with the same state and a smaller subset was already seen,
+        # since any word rejected from the larger subset is rejected from
+        # the smaller one too.
+        if other is None:
+            other = NFA.create(
+                initial_state='q0',
+                transitions={('q0', a): {'q0'} for a in self.alphabet},
+                final_states={'q0'},
+                )
+
+        this, other = self.trim().compile(), other.to_nfa().trim().compile()
+        post = {}
+
+        # one symbol for each pair of classes it can tell apart
+        columns = {}
+        for symbol in sorted(other.symbols):
+            key = (other.symbols[symbol], this.symbols.get(symbol, -1))
+            columns.setdefault(key, symbol)
+
+        def rejected(q, states):
+            return other.final_states >> q & 1 and \
+                not states & this.final_states
+
+        def bits(mask):
+            while mask:
+                low = mask & -mask
+                yield low.bit_length() - 1
+                mask ^= low
+
+        antichain, seen = defaultdict(list), set()
+
+        def add(q, states):
+            # anything seen before is either kept or subsumed already
+            if (q, states) in seen:
+                return False
+            seen.add((q, states))
 
-        return DFA.create(
-            initial_state=trans[initial_state],
-            transitions={
-                (trans[k[0]], k[1]): trans[v] for k, v in transitions.items()
-                },
-            final_states={trans[q] for q in visited if is_final(q)},
-            )
+            minimal = antichain[q]
+            if any(s | states == states for s in minimal):
+                return False
+            minimal[:] = [s for s in minimal if s | states != s]
+            minimal.append(states)
+            return True
+
+        previous = {}
+        pending = deque()
+        for q in bits(other.initial_state):
+            if add(q, this.initial_state):
+                pending.append((q, this.initial_state))
+
+        while pending:
+            state = pending.popleft()
+            q, states = state
+            if states not in antichain[q]:
+                continue  # subsumed since it was queued
+
+            if rejected(q, states):
+                word = []
+                while state in previous:
+                    state, symbol = previous[state]
+                    word.append(symbol)
+                return ''.join(reversed(word))
+
+            for (index, klass), symbol in columns.items():
+                new_states = post.get((states, klass))
+                if new_states is None:
+                    new_states = post[(states, klass)] = \
+                        this.move(states, klass) if klass >= 0 else 0
+                for r in bits(other.targets[index][q]):
+                    if add(r, new_states):
+                        previous[(r, new_states)] = (state, symbol)
+                        pending.append((r, new_states))
+
+        return None
 
     def to_nfa(self):
         return self
@@ -252,6 +542,117 @@ class NFA(NamedTuple):
         return f
 
 
+# positions of the set bits of every byte
+BITS = tuple(
+    tuple(i for i in range(8) if byte >> i & 1) for byte in range(256)
+    )
+
+
+class CompiledNFA(NamedTuple):
+    # states are numbered and sets of them are ints used as bitmasks;
+    # `symbols` maps each symbol to its class and `targets[a][q]` is
+    # everything reachable from `q` on class `a`, with epsilon closures
+    # already applied on both ends
+    states: Tuple[State, ...]
+    symbols: Dict[Symbol, int]
+    classes: Tuple[Tuple[Symbol, ...], ...]
+    initial_state: int
+    targets: Tuple[Tuple[int, ...], ...]
+    final_states: int
+    # per class, targets of each (byte offset, byte value) of a state set,
+    # filled in as they are needed
+    chunks: Tuple[Dict[Tuple[int, int], int], ...]
+
+    def accept(self, word) -> bool:
+        state = self.initial_state
+        for symbol in word:
+            state = self.step(state, symbol)
+            if not state:
+                return False
+        return bool(state & self.final_states)
+
+    def step(self, states: int, symbol: Symbol) -> int:
+        index = self.symbols.get(symbol)
+        if index is None:
+            return 0
+        return self.move(states, index)
+
+    def move(self, states: int, index: int) -> int:
+        row, chunks, result = self.targets[index], self.chunks[index], 0
+
+        # few states spread over many bytes are cheaper to walk bit by bit;
+        # past one bit per eight bytes, scanning the bytes wins
+        rest, budget = states, states.bit_length() >> 6
+        while rest and budget:
+            low = rest & -rest
+            result |= row[low.bit_length() - 1]
+            rest ^= low
+            budget -= 1
+        if not rest:
+            return result
+
+        result = 0
+        data = states.to_bytes((states.bit_length() + 7) // 8, 'little')
+        for offset, byte in enumerate(data):
+            if not byte:
+                continue
+
+            targets = chunks.get((offset, byte))
+            if targets is None:
+                targets = 0
+                for i in BITS[byte]:
+                    targets |= row[offset * 8 + i]
+                chunks[(offset, byte)] = targets
+            result |= targets
+        return result
+
+    def names(self, states: int) -> StateSet:
+        return frozenset(
+            q for i, q in enumerate(self.states) if states >> i & 1
+            )
+
+
+class LazyDFA:
+    # determinizes an NFA while it is being run: subsets (as bitmasks) keep
+    # their outgoing transitions as they are discovered, in a LRU cache
+    # holding at most `max_states` subsets
+    __slots__ = ('nfa', 'max_states', 'initial_state', '_cache')
+
+    def __init__(self, nfa: NFA, max_states=10000):
+        self.nfa = nfa.compile()
+        self.max_states = max_states
+        self.initial_state = self.nfa.initial_state
+        self._cache = OrderedDict()
+
+    def accept(self, word) -> bool:
+        state = self.initial_state
+        for symbol in word:
+            state = self.step(state, symbol)
+            if not state:
+                return False
+        return bool(state & self.nfa.final_states)
+
+    def step(self, states: int, symbol: Symbol) -> int:
+        # rows are keyed by class, so symbols of a class share their entries
+        index = self.nfa.symbols.get(symbol)
+        if index is None:
+            return 0
+
+        cache = self._cache
+        row = cache.get(states)
+        if row is None:
+            if len(cache) >= self.max_states:
+                cache.popitem(last=False)
+            row = cache[states] = {}
+        else:
+            cache.move_to_end(states)
+
+        target = row.get(index)
+        if target is None:
+            target = row[index] = self.nfa.move(states, index)
+        return target
+
+
 def load_nfa(fp) -> NFA:
     raw = json.load(fp=fp)
 
@@ -0,0 +1,103 @@
+from array import array
+from collections import defaultdict, deque
+from typing import FrozenSet, List, NamedTuple, Tuple
+
+from dfa import DFA, CompiledDFA, Matcher
+
+NONE = frozenset()
+
+
+class PatternSet(NamedTuple):
+    # many automata run as a single DFA, their product: each state stands
+    # for the (pattern, state) pairs still alive, and `tags` has the ids
+    # (positions in the list they came in) of the patterns it accepts for
+    dfa: CompiledDFA
+    tags: Tuple[FrozenSet[int], ...]
+
+    @classmethod
+    def create(cls, automata):
+        automata = [automaton.to_dfa().compile() for automaton in automata]
+
+        # symbols taking every automaton through the same columns share one
+        # column of the product
+        columns = defaultdict(list)
+        symbols = sorted(set().union(*(a.symbols for a in automata)))
+        for symbol in symbols:
+            key = tuple(a.symbols.get(symbol, -1) for a in automata)
+            columns[key].append(symbol)
+
+        initial_state = tuple(
+            (i, a.initial_state) for i, a in enumerate(automata)
+            )
+        ids = {initial_state: 0}
+        states = deque([initial_state])
+        rows = []
+
+        while states:
+            state = states.popleft()
+
+            row = []
+            for key in columns:
+                new_state = []
+                for i, q in state:
+                    a, column = automata[i], key[i]
+                    if column >= 0:
+                        r = a.table[q * len(a.classes) + column]
+                        if r >= 0:
+                            new_state.append((i, r))
+
+                # none left alive is the error state
+                new_state = tuple(new_state)
+                if not new_state:
+                    row.append(-1)
+                    continue
+
+                if new_state not in ids:
+                    ids[new_state] = len(ids)
+                    states.append(new_state)
+                row.append(ids[new_state])
+            rows.append(row)
+
+        tags = tuple(
+            frozenset(i for i, q in state if q in automata[i].final_states)
+            for state in ids
+            )
+
+        return cls(CompiledDFA(
+            states=tuple(f'q{i}' for i in range(len(ids))),
+            symbols={
+                symbol: column
+                for column, group in enumerate(columns.values())
+                for symbol in group
+                },
+            classes=tuple(map(tuple, columns.values())),
+            initial_state=0,
+            table=array('i', (q for row in rows for q in row)),
+            final_states=frozenset(i for i, tag in enumerate(tags) if tag),
+            ), tags)
+
+    def match(self, word) -> FrozenSet[int]:
+        # the ids of every pattern accepting the word, in one pass
+        dfa = self.dfa
+        table, symbols, width = dfa.table, dfa.symbols, len(dfa.classes)
+        state = dfa.initial_state
+        for symbol in word:
+            column = symbols.get(symbol)
+            if column is None:
+                return NONE
+            state = table[state * width + column]
+            if state < 0:
+                return NONE
+        return self.tags[state]
+
+    def match_many(self, words) -> List[FrozenSet[int]]:
+        tags = self.tags + (NONE,)
+        return [tags[q] for q in self.dfa.run_many(words)]
+
+    def matcher(self) -> Matcher:
+        # its state indexes `tags` while it is not negative
+        return self.dfa.matcher()
+
+    def to_dfa(self) -> DFA:
+        # accepts what any of the patterns accepts
+        return self.dfa.to_dfa()
@@ -0,0 +1,439 @@
+import re
+import string
+from collections import OrderedDict, defaultdict, deque
+from typing import Dict, FrozenSet, NamedTuple, Tuple, Union as Either
+
+from dfa import DFA
+from nfa import NFA
+
+# what `.` and negated classes range over, unless told otherwise. NFA.EPSILON
+# can't be a symbol, so it can't be matched either.
+ALPHABET = frozenset(string.printable) - {NFA.EPSILON}
+
+DIGITS = frozenset(string.digits)
+WORD = frozenset(string.ascii_letters + string.digits + '_')
+SPACE = frozenset(string.whitespace)
+
+SPECIAL = set('()[|*+?.\\^$')
+ESCAPES = {'n': '\n', 'r': '\r', 't': '\t', 'f': '\f', 'v': '\v'}
+QUANTIFIER = re.compile(r'\{(\d*)(,(\d*))?\}')
+
+
+class Symbols(NamedTuple):
+    # any single character from the set
+    chars: FrozenSet[str]
+
+
+class Concat(NamedTuple):
+    items: Tuple['Node', ...]
+
+
+class Union(NamedTuple):
+    items: FrozenSet['Node']
+
+
+class Star(NamedTuple):
+    item: 'Node'
+
+
+Node = Either[Symbols, Concat, Union, Star]
+
+# the empty word, and the empty language
+EMPTY_WORD = Concat(())
+NOTHING = Union(frozenset())
+
+
+# the constructors below keep expressions in a canonical form (flattened,
+# without neutral items, unions as sets with their characters merged), so
+# that equivalent derivatives mostly come out equal
+
+def symbols(chars) -> Node:
+    chars = frozenset(chars)
+    return Symbols(chars) if chars else NOTHING
+
+
+def concat(*items) -> Node:
+    result = []
+    for item in items:
+        if item == NOTHING:
+            return NOTHING
+        result.extend(item.items if isinstance(item, Concat) else (item,))
+    return result[0] if len(result) == 1 else Concat(tuple(result))
+
+
+def union(*items) -> Node:
+    result, chars = set(), set()
+    for item in items:
+        for item in item.items if isinstance(item, Union) else (item,):
+            if isinstance(item, Symbols):
+                chars |= item.chars
+            else:
+                result.add(item)
+    if chars:
+        result.add(Symbols(frozenset(chars)))
+    return next(iter(result)) if len(result) == 1 else Union(frozenset(result))
+
+
+def star(item) -> Node:
+    if item in (EMPTY_WORD, NOTHING):
+        return EMPTY_WORD
+    return item if isinstance(item, Star) else Star(item)
+
+
+def parse(pattern: str, alphabet=ALPHABET) -> Node:
+    # alternation := sequence ('|' sequence)*
+    # sequence    := repeat*
+    # repeat      := atom ('*' | '+' | '?' | '{m}' | '{m,}' | '{m,n}')*
+    # atom        := '(' ['?:'] alternation ')' | '[' class ']' | '.'
+    #              | '\' escape | character
+    alphabet = frozenset(alphabet)
+    position = 0
+
+    def error(message):
+        return ValueError(f'{message} at position {position}: {pattern!r}')
+
+    def peek():
+        return pattern[position] if position < len(pattern) else None
+
+    def take():
+        nonlocal position
+        char = peek()
+        if char is None:
+            raise error('unexpected end of pattern')
+        position += 1
+        return char
+
+    def alternation():
+        items = [sequence()]
+        while peek() == '|':
+            take()
+            items.append(sequence())
+        return union(*items)
+
+    def sequence():
+        items = []
+        while peek() not in (None, '|', ')'):
+            items.append(repeat())
+        return concat(*items)
+
+    def repeat():
+        nonlocal position
+        item = atom()
+        while True:
+            char = peek()
+            if char == '*':
+                take()
+                item = star(item)
+            elif char == '+':
+                take()
+                item = concat(item, star(item))
+            elif char == '?':
+                take()
+                item = union(EMPTY_WORD, item)
+            elif char == '{' and quantifier():
+                match = quantifier()
+                position = match.end()
+                least = int(match.group(1) or 0)
+                most = least if match.group(2) is None else \
+                    int(match.group(3)) if match.group(3) else None
+                if most is not None and most < least:
+                    raise error('bad repetition range')
+                item = repetition(item, least, most)
+            else:
+                return item
+
+    def quantifier():
+        # as in `re`, braces that don't make a quantifier are literal
+        match = QUANTIFIER.match(pattern, position)
+        return match if match and match.group() != '{}' else None
+
+    def atom():
+        char = take()
+        if char == '(':
+            if pattern.startswith('?:', position):
+                take(), take()
+            item = alternation()
+            if peek() != ')':
+                raise error('missing )')
+            take()
+            return item
+        if char == '[':
+            return symbols(klass())
+        if char == '.':
+            return symbols(alphabet)
+        if char == '\\':
+            return symbols(escape())
+        if char in SPECIAL:
+            raise error(f'unexpected {char!r}')
+        return symbols(literal(char))
+
+    def klass():
+        negated = peek() == '^'
+        if negated:
+            take()
+
+        chars = set()
+        first = True
+        while first or peek() != ']':
+            first = False
+            char = take()
+            if char == '\\':
+                chars |= escape()
+                continue
+            if peek() == '-' and pattern[position + 1:position + 2] not in \
+                    ('', ']'):
+                take()
+                last = take()
+                if last == '\\':
+                    last = ''.join(escape())
+                if len(last) != 1 or last < char:
+                    raise error('bad character range')
+                chars.update(map(chr, range(ord(char), ord(last) + 1)))
+                chars.discard(NFA.EPSILON)
+            else:
+                chars |= literal(char)
+        take()
+
+        return alphabet - chars if negated else frozenset(chars)
+
+    def escape():
+        char = take()
+        classes = {'d': DIGITS, 'w': WORD, 's': SPACE}
+        if char in classes:
+            return classes[char]
+        if char.lower() in classes:
+            return alphabet - classes[char.lower()]
+        return literal(ESCAPES.get(char, char))
+
+    def literal(char):
+        if char == NFA.EPSILON:
+            raise error(f'{NFA.EPSILON!r} is the epsilon symbol')
+        return frozenset(char)
+
+    tree = alternation()
+    if position < len(pattern):
+        raise error(f'unexpected {peek()!r}')
+    return tree
+
+
+def repetition(item: Node, least: int, most=None) -> Node:
+    # optional copies are nested, (x(x)?)? rather than x?x?, so that they
+    # don't all follow each other
+    if most is None:
+        return concat(*(item,) * least, star(item))
+
+    optional = EMPTY_WORD
+    for _ in range(most - least):
+        optional = union(EMPTY_WORD, concat(item, optional))
+    return concat(*(item,) * least, optional)
+
+
+def glushkov(tree: Node):
+    # numbers the characters of the expression (its positions) from 1, and
+    # works out which positions can start and end a word and which can
+    # follow each other; returns the symbols of each position (0 is left
+    # empty for the initial state), whether the empty word is matched, the
+    # first positions, the last ones and the follow sets
+    positions = [frozenset()]
+    follow = defaultdict(set)
+
+    def visit(node):
+        if isinstance(node, Symbols):
+            positions.append(node.chars)
+            i = len(positions) - 1
+            return False, [i], [i]
+
+        if isinstance(node, Union):
+            empty, first, last = False, [], []
+            for item in node.items:
+                n, f, l = visit(item)
+                empty = empty or n
+                first.extend(f)
+                last.extend(l)
+            return empty, first, last
+
+        if isinstance(node, Concat):
+            empty, first, last = True, [], []
+            for item in node.items:
+                n, f, l = visit(item)
+                for p in last:
+                    follow[p].update(f)
+                if empty:
+                    first.extend(f)
+                last = last + l if n else l
+                empty = empty and n
+            return empty, first, last
+
+        n, f, l = visit(node.item)
+        for p in l:
+            follow[p].update(f)
+        return True, f, l
+
+    empty, first, last = visit(tree)
+    return positions, empty, first, last, follow
+
+
+def to_nfa(pattern: str, alphabet=ALPHABET) -> NFA:
+    # the Glushkov automaton: a state for each position besides the initial
+    # one, entered only by reading its symbols, so there are no epsilon
+    # transitions to remove
+    positions, empty, first, last, follow = glushkov(
+        parse(pattern, alphabet))
+
+    transitions = defaultdict(set)
+    for i, targets in ((0, first), *follow.items()):
+        for j in targets:
+            for symbol in positions[j]:
+                transitions[(f'q{i}', symbol)].add(f'q{j}')
+
+    final_states = {f'q{i}' for i in last}
+    if empty:
+        final_states.add('q0')
+
+    return NFA.create(
+        initial_state='q0',
+        transitions=transitions,
+        final_states=final_states,
+        )
+
+
+def to_dfa(pattern: str, alphabet=ALPHABET, minimize=True) -> DFA:
+    dfa = to_nfa(pattern, alphabet).to_dfa()
+    if minimize:
+        dfa = dfa.minimize()
+    # symbols the pattern can't match still belong to the alphabet, which
+    # matters for complements
+    return dfa._replace(alphabet=dfa.alphabet | frozenset(alphabet))
+
+
+def nullable(node: Node) -> bool:
+    if isinstance(node, Symbols):
+        return False
+    if isinstance(node, Concat):
+        return all(map(nullable, node.items))
+    if isinstance(node, Union):
+        return any(map(nullable, node.items))
+    return True
+
+
+def derivative(node: Node, symbol: str) -> Node:
+    # the words w such that `symbol` followed by w matches `node`
+    if isinstance(node, Symbols):
+        return EMPTY_WORD if symbol in node.chars else NOTHING
+    if isinstance(node, Union):
+        return union(*(derivative(item, symbol) for item in node.items))
+    if isinstance(node, Star):
+        return concat(derivative(node.item, symbol), node)
+
+    # the symbol is read by the first item, or by a later one when all the
+    # items before it may match the empty word; the rest of the
+    # concatenation is canonical already, so only the derived head needs care
+    result = []
+    for i, item in enumerate(node.items):
+        head = derivative(item, symbol)
+        if head != NOTHING:
+            items = head.items if isinstance(head, Concat) else (head,)
+            items += node.items[i + 1:]
+            result.append(items[0] if len(items) == 1 else Concat(items))
+        if not nullable(item):
+            break
+    return union(*result)
+
+
+class DerivativeDFA:
+    # matches a regular expression through Brzozowski derivatives: states
+    # are canonical expressions, built only once the input reaches them, and
+    # keep their transitions in a LRU cache holding at most `max_states`
+    # states. `classes` maps each character to the smallest one behaving
+    # like it, so derivatives are only taken once per class.
+    __slots__ = ('initial_state', 'max_states', 'classes', '_cache')
+
+    def __init__(self, pattern: str, alphabet=ALPHABET, max_states=10000):
+        self.initial_state = parse(pattern, alphabet)
+        self.max_states = max_states
+        self.classes = _classes(self.initial_state, alphabet)
+        self._cache = OrderedDict()
+
+    def accept(self, word) -> bool:
+        state = self.initial_state
+        for symbol in word:
+            state = self.step(state, symbol)
+            if state == NOTHING:
+                return False
+        return nullable(state)
+
+    def step(self, state: Node, symbol: str) -> Node:
+        symbol = self.classes.get(symbol)
+        if symbol is None:
+            return NOTHING
+
+        cache = self._cache
+        row = cache.get(state)
+        if row is None:
+            if len(cache) >= self.max_states:
+                cache.popitem(last=False)
+            row = cache[state] = {}
+        else:
+            cache.move_to_end(state)
+
+        target = row.get(symbol)
+        if target is None:
+            target = row[symbol] = derivative(state, symbol)
+        return target
+
+    def to_dfa(self) -> DFA:
+        # explores every derivative breadth-first, naming them q0, q1, ...;
+        # NOTHING is left out as the error state
+        members = defaultdict(list)
+        for symbol, representative in sorted(self.classes.items()):
+            members[representative].append(symbol)
+
+        ids = {self.initial_state: 'q0'}
+        states = deque([self.initial_state])
+        transitions = {}
+
+        while states:
+            state = states.popleft()
+
+            for representative, symbols in members.items():
+                new_state = self.step(state, representative)
+                if new_state == NOTHING:
+                    continue
+
+                if new_state not in ids:
+                    ids[new_state] = f'q{len(ids)}'
+                    states.append(new_state)
+
+                for symbol in symbols:
+                    transitions[(ids[state], symbol)] = ids[new_state]
+
+        return DFA.create(
+            initial_state='q0',
+            transitions=transitions,
+            final_states={q for node, q in ids.items() if nullable(node)},
+            alphabet=self.classes,
+            )
+
+
+def _classes(tree: Node, alphabet) -> Dict[str, str]:
+    # groups characters by the sets of the expression holding them
+    sets, nodes = set(), [tree]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, Symbols):
+            sets.add(node.chars)
+        elif isinstance(node, Star):
+            nodes.append(node.item)
+        else:
+            nodes.extend(node.items)
+
+    signatures = dict.fromkeys(frozenset(alphabet).union(*sets), 0)
+    for i, chars in enumerate(sets):
+        for char in chars:
+            signatures[char] |= 1 << i
+
+    representatives = {}
+    return {
+        char: representatives.setdefault(signatures[char], char)
+        for char in sorted(signatures)
+        }
@@ -0,0 +1,154 @@
+import mmap
+from array import array
+from collections import deque
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+from dfa import CompiledDFA
+
+Span = Tuple[int, int]
+
+
+class Searcher(NamedTuple):
+    # finds the words of a language inside a longer text, leftmost-longest
+    # first, as `re.finditer` would.
+    #
+    # The forward automaton is Σ*L run with every start position at once:
+    # its states are the states of L reached from each start still alive,
+    # ordered by start and keeping only the first of equal ones, since they
+    # can't behave differently anymore. Once a start matches, later ones are
+    # dropped and no new ones are taken, so the run ends where the leftmost
+    # match can't grow anymore, having seen its end. The reverse automaton
+    # then reads back from that end to find where it started.
+    symbols: Dict[str, int]
+    # columns of each byte value, for bytes-like input read as latin-1
+    byte_columns: Tuple[int, ...]
+    initial_state: int
+    # `width` columns per state, the last one for symbols outside the
+    # alphabet; -1 once the leftmost match can't grow anymore
+    table: array
+    width: int
+    # whether the leftmost match found so far ends at the state
+    matching: bytes
+    reverse: CompiledDFA
+
+    @classmethod
+    def create(cls, automaton):
+        language = automaton.to_dfa().compile()
+        initial, final_states = language.initial_state, language.final_states
+        width = len(language.classes)
+
+        def settle(threads, recorded):
+            # `recorded` is the index of the leftmost start matched so far,
+            # or where it was if it died, -1 if none did yet
+            if recorded < 0 and initial not in threads:
+                threads += (initial,)
+            for i, q in enumerate(threads):
+                if q in final_states:
+                    if recorded < 0 or i <= recorded:
+                        return threads[:i + 1], i
+                    break
+            return threads, recorded
+
+        def step(state, column):
+            threads, recorded = state
+            new_threads, new_recorded = [], recorded
+            for i, q in enumerate(threads):
+                if i == recorded:
+                    new_recorded = len(new_threads)
+                r = language.table[q * width + column] if column < width \
+                    else -1
+                if r >= 0 and r not in new_threads:
+                    new_threads.append(r)
+            if recorded >= len(threads):
+                new_recorded = len(new_threads)
+
+            if recorded >= 0 and not new_threads:
+                return None
+            return settle(tuple(new_threads), new_recorded)
+
+        def is_matching(state):
+            threads, recorded = state
+            return 0 <= recorded < len(threads) and \
+                threads[recorded] in final_states
+
+        initial_state = settle((), -1)
+        ids = {initial_state: 0}
+        states = deque([initial_state])
+        table, matching = array('i'), bytearray()
+
+        while states:
+            state = states.popleft()
+            matching.append(is_matching(state))
+
+            for column in range(width + 1):
+                new_state = step(state, column)
+                if new_state is None:
+                    table.append(-1)
+                    continue
+
+                if new_state not in ids:
+                    ids[new_state] = len(ids)
+                    states.append(new_state)
+                table.append(ids[new_state])
+
+        return cls(
+            symbols=language.symbols,
+            byte_columns=tuple(
+                language.symbols.get(chr(b), width) for b in range(256)
+                ),
+            initial_state=0,
+            table=table,
+            width=width + 1,
+            matching=bytes(matching),
+            reverse=automaton.reverse().to_dfa().compile(),
+            )
+
+    def finditer(self, text) -> Iterator[Span]:
+        # yields the (start, end) of each match, not overlapping; bytes-like
+        # buffers such as mmaps are read in place
+        table, width, matching = self.table, self.width, self.matching
+        reverse = self.reverse
+        reverse_width = len(reverse.classes)
+
+        if isinstance(text, (bytes, bytearray, memoryview, mmap.mmap)):
+            text = memoryview(text).cast('B')
+            column = dict(enumerate(self.byte_columns)).get
+            reverse_column = {
+                b: reverse.symbols[chr(b)]
+                for b in range(256) if chr(b) in reverse.symbols
+                }.get
+        else:
+            column, reverse_column = self.symbols.get, reverse.symbols.get
+
+        unknown, position, length = width - 1, 0, len(text)
+        while position <= length:
+            state = self.initial_state
+            end = position if matching[state] else -1
+            for i in range(position, length):
+                state = table[state * width + column(text[i], unknown)]
+                if state < 0:
+                    break
+                if matching[state]:
+                    end = i + 1
+
+            if end < 0:
+                return
+
+            # the leftmost start is the furthest the match reads back to
+            state = reverse.initial_state
+            start = end
+            for i in range(end - 1, position - 1, -1):
+                index = reverse_column(text[i])
+                if index is None:
+                    break
+                state = reverse.table[state * reverse_width + index]
+                if state < 0:
+                    break
+                if state in reverse.final_states:
+                    start = i
+
+            yield start, end
+            position = end if end > start else end + 1
+
+    def search(self, text) -> Optional[Span]:
+        return next(self.finditer(text), None)
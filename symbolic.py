@@ -0,0 +1,379 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import cached_property
+from itertools import chain
+from typing import Dict, FrozenSet, NamedTuple, Optional, Tuple
+
+from dfa import DFA
+from nfa import NFA
+
+State = str
+# sorted, disjoint and non-adjacent inclusive ranges of code points
+Ranges = Tuple[Tuple[int, int], ...]
+
+MAX_CODE_POINT = 0x10FFFF
+
+
+def ranges(*spans) -> Ranges:
+    # spans are characters, code points or (first, last) pairs of either
+    def point(c):
+        return ord(c) if isinstance(c, str) else c
+
+    pairs = sorted(
+        (point(s), point(s)) if isinstance(s, (str, int))
+        else (point(s[0]), point(s[1]))
+        for s in spans
+        )
+
+    result = []
+    for lo, hi in pairs:
+        if lo > hi:
+            continue
+        if result and lo <= result[-1][1] + 1:
+            result[-1] = (result[-1][0], max(result[-1][1], hi))
+        else:
+            result.append((lo, hi))
+    return tuple(result)
+
+
+def complement(label: Ranges) -> Ranges:
+    result, start = [], 0
+    for lo, hi in label:
+        if start < lo:
+            result.append((start, lo - 1))
+        start = hi + 1
+    if start <= MAX_CODE_POINT:
+        result.append((start, MAX_CODE_POINT))
+    return tuple(result)
+
+
+class Partition(NamedTuple):
+    # splits all code points into minterms, classes that every label either
+    # contains or misses entirely. Code points from `bounds[k]` up to the
+    # next bound belong to minterm `classes[k]`.
+    bounds: Tuple[int, ...]
+    classes: Tuple[int, ...]
+    minterms: Tuple[Ranges, ...]
+
+    @classmethod
+    def create(cls, labels):
+        labels = sorted(set(labels))
+        bounds = sorted({0}.union(*(
+            (lo, hi + 1) for label in labels for lo, hi in label
+            )) - {MAX_CODE_POINT + 1})
+
+        # which labels hold each run, as a bitmask
+        signatures = [0] * len(bounds)
+        for j, label in enumerate(labels):
+            for lo, hi in label:
+                for k in range(bisect_left(bounds, lo),
+                               bisect_left(bounds, hi + 1)):
+                    signatures[k] |= 1 << j
+
+        # minterms are numbered by their first code point
+        ids = {}
+        classes = tuple(ids.setdefault(s, len(ids)) for s in signatures)
+        minterms = [[] for _ in ids]
+        for k, i in enumerate(classes):
+            end = bounds[k + 1] - 1 if k + 1 < len(bounds) else MAX_CODE_POINT
+            minterms[i].append((bounds[k], end))
+
+        return cls(tuple(bounds), classes, tuple(map(tuple, minterms)))
+
+    def classify(self, code_point: int) -> int:
+        return self.classes[bisect_right(self.bounds, code_point) - 1]
+
+    def covering(self, label: Ranges) -> FrozenSet[int]:
+        bounds, result = self.bounds, set()
+        for lo, hi in label:
+            result.update(self.classes[bisect_right(bounds, lo) - 1:
+                                       bisect_left(bounds, hi + 1)])
+        return frozenset(result)
+
+    @staticmethod
+    def symbol(minterm: int) -> str:
+        # the symbol standing for a minterm in the explicit automata: the
+        # character with its index as code point, skipping NFA.EPSILON
+        return chr(minterm + (minterm >= ord(NFA.EPSILON)))
+
+    @staticmethod
+    def minterm(symbol: str) -> int:
+        code_point = ord(symbol)
+        return code_point - (code_point > ord(NFA.EPSILON))
+
+    def translate(self, word) -> str:
+        # a word over the explicit automata, one symbol per minterm
+        return ''.join(self.symbol(self.classify(ord(c))) for c in word)
+
+    def example(self, word) -> str:
+        # the inverse of translate, picking the first code point of each
+        return ''.join(
+            chr(self.minterms[self.minterm(c)][0][0]) for c in word)
+
+
+class _SymbolicDFA(NamedTuple):
+    states: FrozenSet[State]
+    initial_state: State
+    transitions: Dict[Tuple[State, Ranges], State]
+    final_states: FrozenSet[State]
+
+
+class SymbolicDFA(_SymbolicDFA):
+    # transitions are labelled with sets of code points instead of single
+    # symbols; labels leaving a state are disjoint, and code points none of
+    # them holds go to the (non-final) error state. Not a NamedTuple itself
+    # so instances get a __dict__ for their cached compiled form.
+
+    def partition(self, *others) -> Partition:
+        return Partition.create(
+            label for automaton in (self, *others)
+            for _, label in automaton.transitions
+            )
+
+    def to_dfa(self, partition: Optional[Partition] = None) -> DFA:
+        # explicit automaton over a symbol for each minterm
+        partition = partition or self.partition()
+        transitions = {}
+        for (src, label), dst in self.transitions.items():
+            for i in partition.covering(label):
+                transitions[(src, partition.symbol(i))] = dst
+
+        return DFA.create(
+            initial_state=self.initial_state,
+            transitions=transitions,
+            final_states=self.final_states,
+            alphabet=map(partition.symbol, range(len(partition.minterms))),
+            )
+
+    @classmethod
+    def from_dfa(cls, dfa: DFA, partition: Optional[Partition] = None):
+        # the inverse of to_dfa; without a partition, every symbol stands
+        # for its own character
+        if DFA.ERROR in dfa.final_states:
+            dfa = dfa.complete()
+
+        spans = defaultdict(list)
+        for (src, symbol), dst in dfa.transitions.items():
+            spans[(src, dst)].extend(
+                partition.minterms[partition.minterm(symbol)] if partition
+                else (symbol,))
+
+        return cls.create(
+            initial_state=dfa.initial_state,
+            transitions={
+                (src, ranges(*s)): dst for (src, dst), s in spans.items()
+                },
+            final_states=dfa.final_states,
+            )
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def difference(self, other):
+        return self.product(other, lambda a, b: a and not b)
+
+    def __invert__(self):
+        return self.complement()
+
+    def complement(self):
+        partition = self.partition()
+        return self.from_dfa(self.to_dfa(partition).complement(), partition)
+
+    def __and__(self, other):
+        return self.intersect(other)
+
+    def intersect(self, other):
+        return self.product(other, lambda a, b: a and b)
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def union(self, other):
+        return self.product(other, lambda a, b: a or b)
+
+    def __xor__(self, other):
+        return self.symmetric_difference(other)
+
+    def symmetric_difference(self, other):
+        return self.product(other, lambda a, b: a != b)
+
+    def product(self, other, accept):
+        # both sides are made explicit over the minterms of all their labels
+        other = other.to_symbolic_dfa()
+        partition = self.partition(other)
+        return self.from_dfa(self.to_dfa(partition).product(
+            other.to_dfa(partition), accept), partition)
+
+    def equivalent(self, other) -> bool:
+        return self.counterexample(other) is None
+
+    def counterexample(self, other) -> Optional[str]:
+        other = other.to_symbolic_dfa()
+        partition = self.partition(other)
+        word = self.to_dfa(partition).counterexample(other.to_dfa(partition))
+        return None if word is None else partition.example(word)
+
+    def is_empty(self) -> bool:
+        return self.shortest_word() is None
+
+    def shortest_word(self) -> Optional[str]:
+        partition = self.partition()
+        word = self.to_dfa(partition).shortest_word()
+        return None if word is None else partition.example(word)
+
+    def minimize(self):
+        partition = self.partition()
+        return self.from_dfa(self.to_dfa(partition).minimize(), partition)
+
+    def accept(self, word) -> bool:
+        return self.compile().accept(word)
+
+    def compile(self) -> 'CompiledSymbolicDFA':
+        return self._compiled
+
+    @cached_property
+    def _compiled(self) -> 'CompiledSymbolicDFA':
+        partition = self.partition()
+        compiled = self.to_dfa(partition).compile()
+
+        # runs of minterms sharing a column are merged into a single bound
+        bounds, columns = array('l'), array('i')
+        for bound, i in zip(partition.bounds, partition.classes):
+            column = compiled.symbols[partition.symbol(i)]
+            if not columns or columns[-1] != column:
+                bounds.append(bound)
+                columns.append(column)
+
+        return CompiledSymbolicDFA(
+            states=compiled.states,
+            bounds=bounds,
+            columns=columns,
+            initial_state=compiled.initial_state,
+            table=compiled.table,
+            final_states=compiled.final_states,
+            )
+
+    def to_symbolic_dfa(self):
+        return self
+
+    def to_symbolic_nfa(self):
+        return SymbolicNFA.create(
+            initial_state=self.initial_state,
+            transitions={k: {v} for k, v in self.transitions.items()},
+            final_states=self.final_states,
+            )
+
+    @classmethod
+    def create(cls, initial_state, transitions, final_states):
+        transitions = {
+            (src, ranges(*label)): dst
+            for (src, label), dst in transitions.items() if label
+            }
+
+        s = chain.from_iterable((k[0], v) for k, v in transitions.items())
+        states = {initial_state} | set(final_states) | set(s)
+
+        return cls(
+            frozenset(states),
+            initial_state,
+            transitions,
+            frozenset(final_states),
+            )
+
+
+class _SymbolicNFA(NamedTuple):
+    states: FrozenSet[State]
+    initial_state: State
+    transitions: Dict[Tuple[State, Ranges], FrozenSet[State]]
+    final_states: FrozenSet[State]
+
+
+class SymbolicNFA(_SymbolicNFA):
+    # as SymbolicDFA, but labels leaving a state may overlap and lead to
+    # sets of states; there are no epsilon transitions
+
+    def partition(self) -> Partition:
+        return Partition.create(label for _, label in self.transitions)
+
+    def to_nfa(self, partition: Optional[Partition] = None) -> NFA:
+        partition = partition or self.partition()
+        transitions = defaultdict(set)
+        for (src, label), dst in self.transitions.items():
+            for i in partition.covering(label):
+                transitions[(src, partition.symbol(i))] |= dst
+
+        return NFA.create(
+            initial_state=self.initial_state,
+            transitions=transitions,
+            final_states=set(self.final_states),
+            )
+
+    def accept(self, word) -> bool:
+        partition, nfa = self._explicit
+        return nfa.accept(partition.translate(word))
+
+    @cached_property
+    def _explicit(self) -> Tuple[Partition, NFA]:
+        # kept for accept, along with the subsets the NFA runs into
+        partition = self.partition()
+        return partition, self.to_nfa(partition)
+
+    def to_symbolic_dfa(self) -> SymbolicDFA:
+        # subset construction over minterms, so each subset is expanded once
+        # per class of code points instead of once per code point
+        partition = self.partition()
+        return SymbolicDFA.from_dfa(
+            self.to_nfa(partition).to_dfa(), partition)
+
+    def to_symbolic_nfa(self):
+        return self
+
+    def minimize(self) -> SymbolicDFA:
+        return self.to_symbolic_dfa().minimize()
+
+    @classmethod
+    def create(cls, initial_state, transitions, final_states):
+        transitions = {
+            (src, ranges(*label)): frozenset(dst)
+            for (src, label), dst in transitions.items() if label and dst
+            }
+
+        s = chain.from_iterable((k[0], *v) for k, v in transitions.items())
+        states = {initial_state} | set(final_states) | set(s)
+
+        return cls(
+            frozenset(states),
+            initial_state,
+            transitions,
+            frozenset(final_states),
+            )
+
+
+class CompiledSymbolicDFA(NamedTuple):
+    # code points from `bounds[k]` up to the next bound take column
+    # `columns[k]` of the table, found by binary search
+    states: Tuple[State, ...]
+    bounds: array
+    columns: array
+    initial_state: int
+    table: array
+    final_states: FrozenSet[int]
+
+    def accept(self, word) -> bool:
+        bounds, columns, table = self.bounds, self.columns, self.table
+        width = len(table) // len(self.states)
+        state = self.initial_state
+        for symbol in word:
+            column = columns[bisect_right(bounds, ord(symbol)) - 1]
+            state = table[state * width + column]
+            if state < 0:
+                return False
+        return state in self.final_states
+
+    def step(self, state: int, symbol: str) -> int:
+        if state < 0:
+            return -1
+        width = len(self.table) // len(self.states)
+        column = self.columns[bisect_right(self.bounds, ord(symbol)) - 1]
+        return self.table[state * width + column]
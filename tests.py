@@ -1,15 +1,24 @@
 import unittest
 
 import io
+import itertools
+import mmap
+import os
+import tempfile
 
-from dfa import DFA, dump_dfa, load_dfa
+from dfa import DFA, dump_dfa, load_dfa, scan_file
+from lexer import Lexer
 from nfa import NFA, dump_nfa, load_nfa
+from patterns import PatternSet
+from regex import DerivativeDFA, derivative, parse, to_dfa, to_nfa
+from symbolic import (
+    MAX_CODE_POINT, Partition, SymbolicDFA, SymbolicNFA, complement, ranges,
+    )
 
 
 class DFATest(unittest.TestCase):
     def assertIsomorphic(self, expected: DFA, value: DFA):
-        self.assertSetEqual(set(), (expected - value).final_states)
-        self.assertSetEqual(set(), (value - expected).final_states)
+        self.assertIsNone(expected.counterexample(value))
 
     def setUp(self):
         self.automaton = DFA(
@@ -56,14 +65,19 @@ class DFATest(unittest.TestCase):
             final_states={'q1'},
             )
 
+        # missing transitions are left to the implicit error state
         complement = ~automaton
         self.assertEqual('q0', complement.initial_state)
         self.assertDictEqual({
             ('q0', 'a'): 'q1',
-            ('q1', 'a'): '-',
-            ('-', 'a'): '-',
             }, complement.transitions)
         self.assertSetEqual({'q0', '-'}, complement.final_states)
+        self.assertTrue(complement.accept(''))
+        self.assertFalse(complement.accept('a'))
+        self.assertTrue(complement.accept('aa'))
+        self.assertFalse(complement.accept('ab'))
+        self.assertTrue(complement.compile().accept('aaa'))
+        self.assertEqual(automaton, ~complement)
 
     def test_concatenate(self):
         automaton1 = DFA.create(
@@ -96,6 +110,28 @@ class DFATest(unittest.TestCase):
         self.assertFalse(concatenate.accept('bb'))
         self.assertIsomorphic(concatenate, expected)
 
+    def test_concatenate_keeps_alphabet(self):
+        automaton1 = DFA.create(
+            initial_state='s0',
+            transitions={
+                ('s0', 'a'): 's1',
+                ('s0', 'c'): 's2',
+                },
+            final_states={'s1'},
+            )
+        automaton2 = DFA.create(
+            initial_state='s0',
+            transitions={
+                ('s0', 'b'): 's1',
+                },
+            final_states={'s1'},
+            )
+
+        concatenate = automaton1 + automaton2
+        self.assertSetEqual({'a', 'b', 'c'}, concatenate.alphabet)
+        self.assertTrue((~concatenate).accept('c'))
+        self.assertFalse((~concatenate).accept('ab'))
+
     def test_difference(self):
         automaton1 = DFA.create(
             initial_state='q0',
@@ -160,10 +196,312 @@ class DFATest(unittest.TestCase):
         self.assertFalse(union.accept('ab'))
         self.assertIsomorphic(expected, union)
 
+    def test_intersect(self):
+        # words with an even number of a's, and words ending in b
+        automaton1 = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): 'q1',
+                ('q0', 'b'): 'q0',
+                ('q1', 'a'): 'q0',
+                ('q1', 'b'): 'q1',
+                },
+            final_states={'q0'},
+            )
+        automaton2 = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): 'q0',
+                ('q0', 'b'): 'q1',
+                ('q1', 'a'): 'q0',
+                ('q1', 'b'): 'q1',
+                },
+            final_states={'q1'},
+            )
+
+        intersection = automaton1 & automaton2
+        self.assertEqual(4, len(intersection.states))
+        self.assertTrue(intersection.accept('aab'))
+        self.assertFalse(intersection.accept('ab'))
+        self.assertFalse(intersection.accept('aa'))
+
+        xor = automaton1 ^ automaton2
+        self.assertTrue(xor.accept('ab'))
+        self.assertTrue(xor.accept('aa'))
+        self.assertFalse(xor.accept('aab'))
+        self.assertFalse(xor.accept('a'))
+
+    def test_intersect_partial(self):
+        automaton1 = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): 'q1',
+                },
+            final_states={'q1'},
+            )
+        automaton2 = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'b'): 'q1',
+                },
+            final_states={'q1'},
+            )
+
+        # no reachable pair besides the initial one survives
+        intersection = automaton1 & automaton2
+        self.assertSetEqual({'q0'}, intersection.states)
+        self.assertSetEqual(set(), intersection.final_states)
+
+    def test_equivalent(self):
+        self.assertTrue(self.automaton.equivalent(self.automaton.minimize()))
+        self.assertTrue(self.automaton.equivalent(
+            self.automaton.to_nfa().to_dfa()))
+
+        # same automaton, but q3 (reached by 11) is no longer final
+        automaton = DFA.create(
+            initial_state=self.automaton.initial_state,
+            transitions=self.automaton.transitions,
+            final_states=self.automaton.final_states - {'q3'},
+            )
+        self.assertFalse(self.automaton.equivalent(automaton))
+        self.assertEqual('11', self.automaton.counterexample(automaton))
+        self.assertEqual('', self.automaton.counterexample(~self.automaton))
+
+    def test_is_empty(self):
+        self.assertFalse(self.automaton.is_empty())
+        self.assertEqual('1', self.automaton.shortest_word())
+
+        automaton = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): 'q1',
+                ('q2', 'a'): 'q3',
+                },
+            final_states={'q3'},
+            )
+        self.assertTrue(automaton.is_empty())
+        self.assertIsNone(automaton.shortest_word())
+
+    def test_count(self):
+        words = [
+            [self.automaton.accept(''.join(w))
+             for w in itertools.product('01', repeat=n)]
+            for n in range(10)
+            ]
+        self.assertListEqual(list(map(sum, words)),
+                             [self.automaton.count(n) for n in range(10)])
+        self.assertEqual(sum(map(sum, words)), self.automaton.count_upto(9))
+        self.assertEqual(0, self.automaton.count_upto(0))
+        with self.assertRaises(ValueError):
+            self.automaton.count(-1)
+
+        # everything but 'a', over 'a' and 'b'
+        complement = ~DFA.create(
+            initial_state='q0',
+            transitions={('q0', 'a'): 'q1', ('q0', 'b'): 'q2'},
+            final_states={'q1'},
+            )
+        self.assertListEqual([1, 1, 4, 8],
+                             [complement.count(n) for n in range(4)])
+        self.assertEqual(3 ** 100, DFA.create(
+            initial_state='q0',
+            transitions={('q0', a): 'q0' for a in 'abc'},
+            final_states={'q0'},
+            ).count(100))
+
+    def test_is_finite(self):
+        self.assertFalse(self.automaton.is_finite())
+        self.assertIsNone(self.automaton.max_word_length())
+
+        # a, ab and abb, with a dead loop past them
+        automaton = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): 'q1',
+                ('q1', 'b'): 'q2',
+                ('q2', 'b'): 'q3',
+                ('q3', 'b'): 'q4',
+                ('q4', 'b'): 'q4',
+                },
+            final_states={'q1', 'q2', 'q3'},
+            )
+        self.assertTrue(automaton.is_finite())
+        self.assertEqual(3, automaton.max_word_length())
+        self.assertEqual(3, automaton.count_upto(10 ** 6))
+        self.assertFalse((~automaton).is_finite())
+
+        empty = DFA.create(initial_state='q0', transitions={},
+                           final_states=set())
+        self.assertTrue(empty.is_finite())
+        self.assertIsNone(empty.max_word_length())
+
+    def test_intersects(self):
+        # words ending in 0, and words with a single 1
+        automaton1 = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', '0'): 'q1',
+                ('q0', '1'): 'q0',
+                ('q1', '0'): 'q1',
+                ('q1', '1'): 'q0',
+                },
+            final_states={'q1'},
+            )
+        automaton2 = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', '0'): 'q0',
+                ('q0', '1'): 'q1',
+                ('q1', '0'): 'q1',
+                },
+            final_states={'q1'},
+            )
+
+        self.assertTrue(automaton1.intersects(automaton2))
+        self.assertFalse(automaton1.disjoint(automaton2))
+        self.assertEqual('10', automaton1.product_witness(
+            automaton2, lambda a, b: a and b))
+        self.assertEqual('1', automaton2.product_witness(
+            automaton1, lambda a, b: a and not b))
+        self.assertTrue(automaton1.disjoint(~automaton1))
+
     def test_accept(self):
         self.assertFalse(self.automaton.accept('101'))
         self.assertTrue(self.automaton.accept('111'))
 
+    def test_compile(self):
+        compiled = self.automaton.compile()
+        self.assertEqual('q0', compiled.states[compiled.initial_state])
+        for word in ('', '0', '1', '101', '111', '0110', '10001', '2'):
+            self.assertEqual(self.automaton.accept(word),
+                             compiled.accept(word))
+
+        state = compiled.step(compiled.initial_state, '1')
+        self.assertEqual('q1', compiled.states[state])
+        self.assertEqual(-1, compiled.step(state, '2'))
+        self.assertEqual(-1, compiled.step(-1, '0'))
+        self.assertEqual(self.automaton, compiled.to_dfa())
+
+    def test_compile_final_error(self):
+        # 'a' leads to s1, which can't reach the final ERROR
+        automaton = DFA.create(
+            initial_state='s0',
+            transitions={
+                ('s0', 'a'): 's1',
+                ('s0', 'b'): 's0',
+                ('s1', 'a'): 's1',
+                ('s1', 'b'): 's1',
+                },
+            final_states={'-'},
+            alphabet='ab',
+            )
+        dfa = automaton.compile().to_dfa()
+        for word in ('', 'a', 'b', 'ba', 'bb', 'ab'):
+            self.assertEqual(automaton.accept(word), dfa.accept(word))
+        self.assertIsomorphic(automaton, dfa)
+
+    def test_accept_many(self):
+        words = ['', '0', '1', '101', '111', '0110', '10001', '2', '12']
+        self.assertListEqual(
+            [self.automaton.accept(word) for word in words],
+            list(self.automaton.accept_many(words)))
+        self.assertListEqual(
+            [self.automaton.accept(word) for word in words],
+            list(self.automaton.accept_many(tuple(w) for w in words)))
+        self.assertEqual(0, len(self.automaton.accept_many([])))
+
+        # an outlier doesn't pad the short words to its length
+        words = ['1', '10', '111', '1' * 5000 + '0', '0' * 3000 + '1']
+        self.assertListEqual(
+            [self.automaton.accept(word) for word in words],
+            list(self.automaton.accept_many(words)))
+
+    def test_dead_and_absorbing(self):
+        # words starting with 'a', over 'a' and 'b'; 'b' first leads to a
+        # state that can't be left
+        automaton = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): 'q1',
+                ('q0', 'b'): 'q2',
+                ('q1', 'a'): 'q1',
+                ('q1', 'b'): 'q1',
+                ('q2', 'a'): 'q2',
+                ('q2', 'b'): 'q2',
+                },
+            final_states={'q1'},
+            )
+        compiled = automaton.compile()
+        self.assertEqual(-1, compiled.step(compiled.initial_state, 'b'))
+        self.assertSetEqual({compiled.states.index('q1')}, compiled.absorbing)
+
+        words = ['', 'a', 'b', 'ab' * 40, 'ba' * 40, 'a' * 40 + 'c', 'abc']
+        expected = [False, True, False, True, False, False, False]
+        for complete in (automaton, automaton.complete().minimize()):
+            self.assertListEqual(expected, list(map(complete.accept, words)))
+            self.assertListEqual(
+                expected, list(map(complete.compile().accept, words)))
+            self.assertListEqual(expected, list(complete.accept_many(words)))
+
+        # q2 is dead without being named ERROR, and accept stops there
+        self.assertTupleEqual(
+            (frozenset({'q2'}), frozenset({'q1'})), automaton._settled)
+        word = iter('ba' * 40)
+        self.assertFalse(automaton.accept(word))
+        self.assertEqual('a', next(word))
+
+        # other bytes could still come and be rejected
+        matcher = compiled.matcher().feed(b'ab')
+        self.assertFalse(matcher.settled)
+        self.assertTrue(matcher.feed(b'ba').accepting)
+        self.assertFalse(matcher.feed('c').accepting)
+        self.assertTrue(compiled.matcher().feed('b').settled)
+        self.assertFalse(compiled.matcher().settled)
+
+    def test_symbol_classes(self):
+        # this automaton accepts words with a digit, over digits and letters
+        automaton = DFA.create(
+            initial_state='q0',
+            transitions={
+                **{('q0', a): 'q0' for a in 'abc'},
+                **{(q, a): 'q1' for q in ('q0', 'q1') for a in '0123'},
+                **{('q1', a): 'q1' for a in 'abc'},
+                },
+            final_states={'q1'},
+            )
+        self.assertTupleEqual((('0', '1', '2', '3'), ('a', 'b', 'c')),
+                              automaton.symbol_classes())
+
+        compiled = automaton.compile()
+        self.assertEqual(2, len(compiled.classes))
+        self.assertEqual(2 * len(compiled.states), len(compiled.table))
+        self.assertEqual(compiled.symbols['0'], compiled.symbols['3'])
+        self.assertTrue(compiled.accept('ab2c'))
+        self.assertFalse(compiled.accept('abc'))
+        self.assertEqual(automaton, compiled.to_dfa())
+        self.assertTrue(compiled.matcher().feed(b'c1').accepting)
+
+    def test_matcher(self):
+        matcher = self.automaton.matcher()
+        self.assertFalse(matcher.accepting)
+        self.assertTrue(matcher.feed('1').accepting)
+        self.assertFalse(matcher.feed(b'0').feed(memoryview(b'1')).accepting)
+        self.assertTrue(matcher.feed(bytearray(b'01')).accepting)
+
+        matcher = self.automaton.matcher().feed('12')
+        self.assertEqual(-1, matcher.state)
+        self.assertFalse(matcher.feed('0').accepting)
+
+    def test_scan_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'word')
+            with open(path, 'wb') as fp:
+                fp.write(b'0110' * 1000 + b'1')
+            self.assertTrue(scan_file(self.automaton, path, 7).accepting)
+
+            open(path, 'wb').close()
+            self.assertFalse(scan_file(self.automaton, path).accepting)
+
     def test_rename(self):
         automaton = DFA.create(
             initial_state='C',
@@ -198,7 +536,7 @@ class DFATest(unittest.TestCase):
             )
 
         cleaned = automaton.remove_unreachable()
-        self.assertSetEqual({'0'}, cleaned.alphabet)
+        self.assertSetEqual({'0', '1'}, cleaned.alphabet)
         self.assertSetEqual({'q0', 'q1'}, cleaned.states)
         self.assertEqual('q0', cleaned.initial_state)
         self.assertDictEqual({
@@ -206,6 +544,38 @@ class DFATest(unittest.TestCase):
             }, cleaned.transitions)
         self.assertSetEqual({'q1'}, cleaned.final_states)
 
+    def test_trim(self):
+        # q2 can't be reached and q3 can't reach a final state
+        automaton = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', '0'): 'q1',
+                ('q0', '1'): 'q3',
+                ('q2', '1'): 'q1',
+                ('q3', '0'): 'q3',
+                },
+            final_states={'q1'},
+            )
+        self.assertSetEqual({'q0', 'q3'}, automaton.predecessors['q3'])
+
+        trimmed = automaton.trim()
+        self.assertIs(trimmed, automaton.trim())
+        self.assertSetEqual({'0', '1'}, trimmed.alphabet)
+        self.assertSetEqual({'q0', 'q1'}, trimmed.states)
+        self.assertDictEqual({
+            ('q0', '0'): 'q1',
+            }, trimmed.transitions)
+        self.assertIs(trimmed, trimmed.trim())
+        self.assertIsomorphic(automaton, trimmed)
+        self.assertIsomorphic(~automaton, ~trimmed)
+
+        # the explicit error state goes, unless it is final
+        self.assertSetEqual({'q0', 'q1'}, automaton.complete().trim().states)
+        complement = ~automaton
+        self.assertSetEqual({'q0', 'q1', 'q3', '-'}, complement.trim().states)
+        self.assertTrue(complement.trim().accept('10'))
+        self.assertFalse(complement.trim().accept('0'))
+
     def test_merge_nondistinguishable(self):
         # this automaton accepts 0*10* but it's bloated, taken from wikipedia
         automaton = DFA.create(
@@ -227,20 +597,111 @@ class DFATest(unittest.TestCase):
             final_states={'q2', 'q3', 'q4'},
             )
 
+        # q5 can never accept, so it is merged into the implicit error state
         cleaned = automaton.merge_nondistinguishable()
-        self.assertSetEqual({'q0', 'q1', 'q2'}, cleaned.states)
+        self.assertSetEqual({'q0', 'q1'}, cleaned.states)
         self.assertEqual(1, len(cleaned.final_states))
         initial = cleaned.initial_state
         final, *_ = cleaned.final_states
-        other, *_ = cleaned.states - {initial, final}
         self.assertDictEqual({
             (initial, '0'): initial,
             (initial, '1'): final,
             (final, '0'): final,
-            (final, '1'): other,
-            (other, '0'): other,
-            (other, '1'): other,
             }, cleaned.transitions)
+        self.assertSetEqual({'0', '1'}, cleaned.alphabet)
+
+    def test_merge_nondistinguishable_partial(self):
+        # q2 can never accept, so it is merged into the implicit error state
+        automaton = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): 'q1',
+                ('q0', 'b'): 'q2',
+                ('q1', 'a'): 'q1',
+                ('q2', 'a'): 'q2',
+                },
+            final_states={'q1'},
+            )
+
+        cleaned = automaton.merge_nondistinguishable()
+        self.assertEqual(2, len(cleaned.states))
+        initial = cleaned.initial_state
+        final, *_ = cleaned.final_states
+        self.assertDictEqual({
+            (initial, 'a'): final,
+            (final, 'a'): final,
+            }, cleaned.transitions)
+
+    def test_minimize(self):
+        minimal = self.automaton.minimize()
+        self.assertEqual('A', minimal.initial_state)
+        self.assertEqual(len(minimal.states), len(minimal.minimize().states))
+        for word in ('', '1', '10', '101', '111', '0110', '10001'):
+            self.assertEqual(self.automaton.accept(word), minimal.accept(word))
+
+    def test_minimize_complete(self):
+        # a materialized sink merges into ERROR like a missing transition
+        automaton = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): 'q1',
+                },
+            final_states={'q1'},
+            alphabet='ab',
+            )
+        self.assertEqual(2, len(automaton.minimize().states))
+        self.assertEqual(automaton.minimize(), automaton.complete().minimize())
+        self.assertEqual(self.automaton.minimize(),
+                         self.automaton.complete().minimize())
+
+    def test_minimize_keeps_alphabet(self):
+        # 'b' only leads to the error state, but complements accept it
+        automaton = DFA.create(
+            initial_state='s0',
+            transitions={
+                ('s0', 'a'): 's1',
+                ('s0', 'b'): 's2',
+                },
+            final_states={'s1'},
+            ) & DFA.create(
+            initial_state='t0',
+            transitions={
+                ('t0', 'a'): 't1',
+                },
+            final_states={'t1'},
+            )
+        minimal = automaton.minimize()
+        self.assertSetEqual({'a', 'b'}, minimal.alphabet)
+        self.assertTrue(automaton.equivalent(minimal))
+        self.assertTrue((~automaton).equivalent(~minimal))
+        self.assertTrue((~minimal).accept('b'))
+
+    def test_minimize_sparse(self):
+        # a-only words with at most one b, so most transitions are missing
+        automaton = DFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): 'q0',
+                ('q0', 'b'): 'q1',
+                ('q1', 'a'): 'q1',
+                },
+            final_states={'q0', 'q1'},
+            )
+
+        minimal = automaton.minimize()
+        self.assertNotIn('-', minimal.states)
+        self.assertEqual(3, len(minimal.transitions))
+
+        complement = (~automaton).minimize()
+        self.assertIn('-', complement.final_states)
+        self.assertEqual(3, len(complement.transitions))
+        self.assertTrue(complement.accept('abab'))
+        self.assertFalse(complement.accept('aba'))
+
+        out = io.StringIO()
+        dump_dfa(out, complement)
+        out.seek(0)
+        self.assertEqual(complement, load_dfa(out))
 
     def test_to_nfa(self):
         automaton = DFA.create(
@@ -359,13 +820,17 @@ class NFATest(unittest.TestCase):
             )
 
         concatenate = automaton1 + automaton2
-        self.assertEqual('q0_0', concatenate.initial_state)
+        self.assertEqual('q0', concatenate.initial_state)
         self.assertDictEqual({
-            ('q0_0', 'a'): {'q1_0'},
-            ('q1_0', NFA.EPSILON): {'q0_1'},
-            ('q0_1', 'b'): {'q1_1'},
+            ('q0', 'a'): {'q1'},
+            ('q1', NFA.EPSILON): {'q2'},
+            ('q2', 'b'): {'q3'},
             }, concatenate.transitions)
-        self.assertSetEqual({'q1_1'}, concatenate.final_states)
+        self.assertSetEqual({'q3'}, concatenate.final_states)
+
+        # names stay short however many operations are chained
+        chained = concatenate + concatenate + concatenate
+        self.assertSetEqual({f'q{i}' for i in range(12)}, chained.states)
 
     def test_union(self):
         automaton1 = NFA.create(
@@ -386,16 +851,51 @@ class NFATest(unittest.TestCase):
         union = automaton1 | automaton2
         self.assertEqual('q0', union.initial_state)
         self.assertDictEqual({
-            ('q0', NFA.EPSILON): {'q0_0', 'q0_1'},
-            ('q0_0', 'a'): {'q1_0'},
-            ('q0_1', 'b'): {'q1_1'},
+            ('q0', NFA.EPSILON): {'q1', 'q3'},
+            ('q1', 'a'): {'q2'},
+            ('q3', 'b'): {'q4'},
             }, union.transitions)
-        self.assertSetEqual({'q1_0', 'q1_1'}, union.final_states)
+        self.assertSetEqual({'q2', 'q4'}, union.final_states)
 
     def test_accept(self):
         self.assertFalse(self.automaton.accept('0110'))
         self.assertTrue(self.automaton.accept('0010'))
 
+    def test_accept_epsilon(self):
+        # this automaton accepts a*b*
+        automaton = NFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): {'q0'},
+                ('q0', NFA.EPSILON): {'q1'},
+                ('q1', 'b'): {'q1'},
+                },
+            final_states={'q1'},
+            )
+
+        self.assertTrue(automaton.accept(''))
+        self.assertTrue(automaton.accept('aabb'))
+        self.assertFalse(automaton.accept('aba'))
+
+    def test_lazy(self):
+        lazy = self.automaton.lazy(max_states=2)
+        for word in ('0110', '0010', '', '1', '0000110', '1111'):
+            self.assertEqual(self.automaton.to_dfa().accept(word),
+                             lazy.accept(word))
+        self.assertLessEqual(len(lazy._cache), 2)
+
+        # accept keeps the subsets it found from one word to the next
+        self.assertTrue(self.automaton.accept('0010'))
+        cache = self.automaton._lazy._cache
+        self.assertTrue(cache)
+        self.assertFalse(self.automaton.accept('02'))
+        self.assertIs(cache, self.automaton._lazy._cache)
+
+        # symbols outside the alphabet don't touch the cache
+        lazy = self.automaton.lazy()
+        self.assertEqual(0, lazy.step(lazy.initial_state, '2'))
+        self.assertFalse(lazy._cache)
+
     def test_epsilon_closure(self):
         automaton = NFA.create(
             initial_state='q0',
@@ -409,6 +909,27 @@ class NFATest(unittest.TestCase):
 
         self.assertSetEqual({'q0', 'q1'}, automaton.epsilon_closure('q0'))
 
+    def test_epsilon_closure_cycle(self):
+        automaton = NFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', NFA.EPSILON): {'q1'},
+                ('q1', NFA.EPSILON): {'q2'},
+                ('q2', NFA.EPSILON): {'q1', 'q3'},
+                ('q3', 'a'): {'q0'},
+                ('q4', NFA.EPSILON): {'q0'},
+                },
+            final_states={'q3'},
+            )
+
+        self.assertSetEqual({'q0', 'q1', 'q2', 'q3'},
+                            automaton.epsilon_closure('q0'))
+        self.assertSetEqual({'q1', 'q2', 'q3'},
+                            automaton.epsilon_closure('q2'))
+        self.assertSetEqual({'q3'}, automaton.epsilon_closure('q3'))
+        self.assertSetEqual(automaton.states, automaton.epsilon_closure('q4'))
+        self.assertIs(automaton.closures, automaton.closures)
+
     def test_step(self):
         automaton = NFA.create(
             initial_state='q0',
@@ -423,6 +944,53 @@ class NFATest(unittest.TestCase):
         self.assertSetEqual({'q0', 'q1'}, automaton.step({'q0'}, 'a'))
         self.assertSetEqual({'q1'}, automaton.step({'q0', 'q1'}, 'b'))
 
+    def test_compile(self):
+        # this automaton accepts a*b*
+        automaton = NFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): {'q0'},
+                ('q0', NFA.EPSILON): {'q1'},
+                ('q1', 'b'): {'q1'},
+                },
+            final_states={'q1'},
+            )
+
+        compiled = automaton.compile()
+        self.assertIs(compiled, automaton.compile())
+        self.assertSetEqual({'q0', 'q1'},
+                            compiled.names(compiled.initial_state))
+        state = compiled.step(compiled.initial_state, 'b')
+        self.assertSetEqual({'q1'}, compiled.names(state))
+        self.assertEqual(0, compiled.step(state, 'a'))
+        self.assertEqual(0, compiled.step(state, 'c'))
+
+        self.assertTrue(compiled.accept(''))
+        self.assertTrue(compiled.accept('aabb'))
+        self.assertFalse(compiled.accept('aba'))
+
+    def test_compile_classes(self):
+        # this automaton accepts words ending in a digit
+        automaton = NFA.create(
+            initial_state='q0',
+            transitions={
+                **{('q0', a): {'q0'} for a in 'ab01'},
+                **{('q0', a): {'q1'} for a in '01'},
+                },
+            final_states={'q1'},
+            )
+
+        compiled = automaton.compile()
+        self.assertTupleEqual((('0', '1'), ('a', 'b')), compiled.classes)
+        self.assertEqual(2, len(compiled.targets))
+        self.assertTrue(compiled.accept('ab1'))
+        self.assertFalse(compiled.accept('a0b'))
+
+        dfa = automaton.to_dfa()
+        self.assertSetEqual({'a', 'b', '0', '1'}, dfa.alphabet)
+        self.assertEqual(dfa.transitions[('q0', '0')],
+                         dfa.transitions[('q0', '1')])
+
     def test_to_dfa(self):
         # this automaton accepts a+
         automaton = NFA.create(
@@ -464,6 +1032,83 @@ class NFATest(unittest.TestCase):
             (final, 'b'): final,
             }, dfa.transitions)
 
+    def test_to_dfa_deterministic(self):
+        # states are numbered in breadth-first order over sorted symbols
+        automaton = NFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): {'q0', 'q1'},
+                ('q0', 'b'): {'q0'},
+                ('q1', 'b'): {'q2'},
+                },
+            final_states={'q2'},
+            )
+
+        dfa = automaton.to_dfa()
+        self.assertEqual('q0', dfa.initial_state)
+        self.assertDictEqual({
+            ('q0', 'a'): 'q1',
+            ('q0', 'b'): 'q0',
+            ('q1', 'a'): 'q1',
+            ('q1', 'b'): 'q2',
+            ('q2', 'a'): 'q1',
+            ('q2', 'b'): 'q0',
+            }, dfa.transitions)
+        self.assertSetEqual({'q2'}, dfa.final_states)
+        self.assertEqual(dfa, automaton.to_dfa())
+
+    def test_to_dfa_steps(self):
+        steps = list(self.automaton.to_dfa_steps())
+        self.assertEqual(len(self.automaton.to_dfa().states), len(steps))
+        self.assertEqual(self.automaton.to_dfa(), steps[-1])
+        self.assertDictEqual({
+            ('q0', '0'): 'q0',
+            ('q0', '1'): 'q1',
+            }, steps[0].transitions)
+        self.assertSetEqual({'q1'}, steps[0].final_states)
+
+    def test_to_dfa_dead_symbols(self):
+        # 'b' only leads to a dead state, but still belongs to the alphabet
+        automaton = NFA.create(
+            initial_state='p',
+            transitions={
+                ('p', 'a'): {'f'},
+                ('p', 'b'): {'d'},
+                },
+            final_states={'f'},
+            )
+        dfa = automaton.to_dfa()
+        self.assertSetEqual({'a', 'b'}, dfa.alphabet)
+        self.assertTrue((~dfa).accept('b'))
+        self.assertFalse((~dfa).accept('a'))
+        self.assertSetEqual(
+            {'a', 'b'}, list(automaton.to_dfa_steps())[-1].alphabet)
+
+    def test_trim(self):
+        automaton = NFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): {'q1', 'q3'},
+                ('q1', '&'): {'q2'},
+                ('q3', 'a'): {'q3'},
+                ('q4', 'a'): {'q2'},
+                },
+            final_states={'q2'},
+            )
+        self.assertSetEqual({'q1', 'q3'}, automaton.successors['q0'])
+
+        trimmed = automaton.trim()
+        self.assertSetEqual({'q0', 'q1', 'q2'}, trimmed.states)
+        self.assertDictEqual({
+            ('q0', 'a'): {'q1'},
+            ('q1', '&'): {'q2'},
+            }, trimmed.transitions)
+        self.assertTrue(trimmed.accept('a'))
+        self.assertFalse(trimmed.accept('aa'))
+
+        # trimmed before they are combined
+        self.assertEqual(7, len((automaton | automaton).states))
+
     def test_remove_epsilon_transitions(self):
         # taken from Ullman slides
         automaton = NFA.create(
@@ -491,6 +1136,57 @@ class NFATest(unittest.TestCase):
             }, epsilon_free.transitions)
         self.assertSetEqual({'q1', 'q2'}, epsilon_free.final_states)
 
+    def test_includes(self):
+        # a*b* includes a*, but neither includes the other nor ab*a
+        automaton = NFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): {'q0'},
+                ('q0', NFA.EPSILON): {'q1'},
+                ('q1', 'b'): {'q1'},
+                },
+            final_states={'q1'},
+            )
+        a_star = NFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): {'q0'},
+                },
+            final_states={'q0'},
+            )
+        ab_star_a = NFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', 'a'): {'q1'},
+                ('q1', 'b'): {'q1'},
+                ('q1', 'a'): {'q2'},
+                },
+            final_states={'q2'},
+            )
+
+        self.assertTrue(automaton.includes(a_star))
+        self.assertTrue(automaton.includes(automaton))
+        self.assertFalse(a_star.includes(automaton))
+        self.assertEqual('b', a_star.inclusion_counterexample(automaton))
+        self.assertFalse(automaton.includes(ab_star_a))
+        self.assertEqual('aba', automaton.inclusion_counterexample(ab_star_a))
+
+    def test_is_universal(self):
+        self.assertFalse(self.automaton.is_universal())
+        self.assertEqual('', self.automaton.inclusion_counterexample())
+
+        # (a|b)* with the choice made up front
+        automaton = NFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', NFA.EPSILON): {'q1', 'q2'},
+                ('q1', 'a'): {'q0'},
+                ('q2', 'b'): {'q0'},
+                },
+            final_states={'q0'},
+            )
+        self.assertTrue(automaton.is_universal())
+
     def test_dump(self):
         out = io.StringIO()
         dump_nfa(out, self.automaton)
@@ -506,5 +1202,325 @@ class NFATest(unittest.TestCase):
         self.assertEqual(self.automaton, automaton)
 
 
+class SymbolicTest(unittest.TestCase):
+    def setUp(self):
+        # this automaton accepts identifiers: a letter (greek ones too)
+        # followed by letters and digits
+        letters = ranges(('a', 'z'), ('A', 'Z'), ('\u03b1', '\u03c9'))
+        self.automaton = SymbolicDFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', letters): 'q1',
+                ('q1', letters): 'q1',
+                ('q1', ranges(('0', '9'))): 'q1',
+                },
+            final_states={'q1'},
+            )
+
+    def test_ranges(self):
+        self.assertTupleEqual(((48, 57), (97, 122)),
+                              ranges(('a', 'm'), ('0', '9'), ('n', 'z')))
+        self.assertTupleEqual(((0, 47), (58, MAX_CODE_POINT)),
+                              complement(ranges(('0', '9'))))
+        self.assertTupleEqual(((0, MAX_CODE_POINT),), complement(()))
+
+    def test_partition(self):
+        partition = Partition.create([
+            ranges(('a', 'z')), ranges(('0', '9'), ('a', 'f')),
+            ])
+        self.assertEqual(4, len(partition.minterms))
+        self.assertEqual(partition.classify(ord('a')),
+                         partition.classify(ord('f')))
+        self.assertNotEqual(partition.classify(ord('f')),
+                            partition.classify(ord('g')))
+        self.assertEqual(partition.classify(0),
+                         partition.classify(MAX_CODE_POINT))
+        self.assertEqual(2, len(partition.covering(ranges(('a', 'z')))))
+
+    def test_accept(self):
+        compiled = self.automaton.compile()
+        for word in ('x', 'abc12', '\u03bb1', 'Zz'):
+            self.assertTrue(self.automaton.accept(word))
+            self.assertTrue(compiled.accept(word))
+        for word in ('', '1a', 'a-b', '\U0001f600'):
+            self.assertFalse(self.automaton.accept(word))
+            self.assertFalse(compiled.accept(word))
+
+        self.assertEqual(-1, compiled.step(compiled.initial_state, '1'))
+        self.assertEqual(-1, compiled.step(-1, 'a'))
+
+        # built once, then shared by every call
+        self.assertIs(compiled, self.automaton.compile())
+        nfa = self.automaton.to_symbolic_nfa()
+        self.assertTrue(nfa.accept('abc12'))
+        self.assertIs(nfa._explicit, nfa._explicit)
+
+    def test_minimize(self):
+        digits = ranges(('0', '9'))
+        automaton = SymbolicDFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', ranges(('a', 'm'))): 'q1',
+                ('q0', ranges(('n', 'z'))): 'q2',
+                ('q1', digits): 'q1',
+                ('q2', digits): 'q2',
+                },
+            final_states={'q1', 'q2'},
+            )
+
+        minimal = automaton.minimize()
+        self.assertEqual(2, len(minimal.states))
+        self.assertIn(ranges(('a', 'z')),
+                      {label for _, label in minimal.transitions})
+        self.assertTrue(minimal.equivalent(automaton))
+
+    def test_product(self):
+        greek = SymbolicDFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', ranges(('\u0370', '\u03ff'))): 'q0',
+                ('q0', ranges(('0', '9'))): 'q0',
+                },
+            final_states={'q0'},
+            )
+
+        both = self.automaton & greek
+        self.assertTrue(both.accept('\u03b1\u03b2'))
+        self.assertFalse(both.accept('a'))
+        self.assertEqual('\u03b1', both.shortest_word())
+
+        either = self.automaton | greek
+        self.assertTrue(either.accept(''))
+        self.assertTrue(either.accept('a1'))
+        self.assertTrue(either.accept('\u0370'))
+
+        self.assertTrue((self.automaton - self.automaton).is_empty())
+        self.assertIsNone(self.automaton.counterexample(either & ~greek |
+                                                        both))
+
+    def test_complement(self):
+        complement = ~self.automaton
+        for word in ('', '1a', 'a-b', '\U0001f600'):
+            self.assertTrue(complement.accept(word))
+        self.assertFalse(complement.accept('abc12'))
+        self.assertTrue((complement & self.automaton).is_empty())
+
+    def test_nfa(self):
+        # this automaton accepts words whose last but one character is a
+        # digit
+        automaton = SymbolicNFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', ((0, MAX_CODE_POINT),)): {'q0'},
+                ('q0', ranges(('0', '9'))): {'q1'},
+                ('q1', ((0, MAX_CODE_POINT),)): {'q2'},
+                },
+            final_states={'q2'},
+            )
+
+        dfa = automaton.to_symbolic_dfa()
+        for word in ('1\u03b1', 'ab3\U0001f600', '00'):
+            self.assertTrue(automaton.accept(word))
+            self.assertTrue(dfa.accept(word))
+        for word in ('', '1', 'a1', '1ab'):
+            self.assertFalse(automaton.accept(word))
+            self.assertFalse(dfa.accept(word))
+
+        self.assertEqual(4, len(automaton.minimize().states))
+        self.assertTrue(dfa.equivalent(automaton))
+
+    def test_many_minterms(self):
+        # 50 labels make more minterms than there are characters before
+        # NFA.EPSILON, which none of their symbols may be
+        automaton = SymbolicNFA.create(
+            initial_state='q0',
+            transitions={
+                ('q0', ranges(c)): {'q1'} for c in range(0x100, 0x132)
+                },
+            final_states={'q1'},
+            )
+        self.assertGreater(len(automaton.partition().minterms), 38)
+        self.assertNotIn(NFA.EPSILON, automaton.to_nfa().alphabet)
+
+        dfa = automaton.to_symbolic_dfa()
+        for symbolic in (automaton, dfa):
+            self.assertFalse(symbolic.accept(''))
+            self.assertTrue(symbolic.accept('\u0125'))
+            self.assertTrue(symbolic.accept('\u0100'))
+            self.assertFalse(symbolic.accept('\u0132'))
+        self.assertEqual('\u0100', dfa.shortest_word())
+
+
+class RegexTest(unittest.TestCase):
+    def test_to_nfa(self):
+        automaton = to_nfa('(a|b)*abb')
+        # a state for each character of the expression, plus the initial
+        # one; (a|b) is read as [ab]
+        self.assertEqual(5, len(automaton.states))
+        self.assertNotIn(NFA.EPSILON,
+                         {symbol for _, symbol in automaton.transitions})
+        for word in ('abb', 'babb', 'aababb'):
+            self.assertTrue(automaton.accept(word))
+        for word in ('', 'ab', 'abba', 'abc'):
+            self.assertFalse(automaton.accept(word))
+
+    def test_syntax(self):
+        cases = {
+            'a+b?c{2,3}': (['acc', 'aabccc'], ['ac', 'abbcc', 'acccc']),
+            '[a-c]+[^a-z]': (['abc1', 'c_'], ['abcd', 'd1', '1']),
+            r'\d{2}-\w+\.': (['12-ab_9.', '00-x.'], ['1-a.', '12-.', '12-a']),
+            '(?:ab|a)(bc|c)?': (['a', 'abc', 'abbc'], ['b', 'abcc']),
+            'a{,2}x{2,}': (['xx', 'aaxxx'], ['aaax', 'x']),
+            'a]}{': (['a]}{'], ['a']),
+            '': ([''], ['a']),
+            }
+        for pattern, (accepted, rejected) in cases.items():
+            automaton = to_nfa(pattern)
+            for word in accepted:
+                self.assertTrue(automaton.accept(word), (pattern, word))
+            for word in rejected:
+                self.assertFalse(automaton.accept(word), (pattern, word))
+
+    def test_errors(self):
+        for pattern in ('(a', 'a)', '*a', '[ab', 'a{3,1}', '[z-a]', 'a&b'):
+            with self.assertRaises(ValueError):
+                to_nfa(pattern)
+
+    def test_to_dfa(self):
+        automaton = to_dfa('(a|b)*abb', alphabet='ab')
+        self.assertEqual(4, len(automaton.states))
+        self.assertSetEqual({'a', 'b'}, automaton.alphabet)
+        self.assertTrue(automaton.accept('babb'))
+        self.assertFalse(automaton.accept('abba'))
+        self.assertTrue(automaton.equivalent(
+            to_dfa('(a|b)*abb', alphabet='ab', minimize=False)))
+
+        complement = ~to_dfa('a*', alphabet='ab')
+        self.assertTrue(complement.accept('ab'))
+        self.assertFalse(complement.accept('aa'))
+
+    def test_derivative(self):
+        self.assertEqual(parse('[bc]'), derivative(parse('ab|ac'), 'a'))
+        self.assertEqual(parse('b*c'), derivative(parse('a*b*c'), 'b'))
+        self.assertEqual(parse('[a-z]*'), derivative(parse('[a-z]*'), 'q'))
+
+    def test_derivative_dfa(self):
+        automaton = DerivativeDFA('(a|b)*a(a|b){20}', max_states=100)
+        word = 'ab' * 200 + 'a' + 'b' * 20
+        self.assertTrue(automaton.accept(word))
+        self.assertFalse(automaton.accept(word + 'b'))
+        self.assertFalse(automaton.accept(word[:-1] + 'c'))
+        self.assertLessEqual(len(automaton._cache), 100)
+
+        automaton = DerivativeDFA('(a|b)*abb')
+        dfa = automaton.to_dfa()
+        self.assertEqual(4, len(dfa.minimize().states))
+        self.assertTrue(dfa.equivalent(to_dfa('(a|b)*abb')))
+
+        fp = io.StringIO()
+        dump_dfa(fp, dfa)
+        fp.seek(0)
+        self.assertEqual(dfa, load_dfa(fp))
+
+
+class PatternSetTest(unittest.TestCase):
+    def setUp(self):
+        self.patterns = [
+            to_dfa('[a-z]+'), to_dfa('if|else'), to_dfa(r'\d+'),
+            to_nfa('[a-z]*e'), ~to_dfa('[a-z]*', alphabet='abc0'),
+            ]
+        self.automaton = PatternSet.create(self.patterns)
+
+    def test_match(self):
+        words = ['if', 'else', 'elif', '42', '', 'a0', 'if!']
+        for word in words:
+            expected = {
+                i for i, pattern in enumerate(self.patterns)
+                if pattern.accept(word)
+                }
+            self.assertSetEqual(expected, self.automaton.match(word), word)
+
+        self.assertSetEqual({0, 1, 3}, self.automaton.match('else'))
+        self.assertListEqual(list(map(self.automaton.match, words)),
+                             self.automaton.match_many(words))
+
+    def test_matcher(self):
+        matcher = self.automaton.matcher().feed(b'el')
+        self.assertSetEqual({0}, self.automaton.tags[matcher.state])
+        matcher.feed('se')
+        self.assertSetEqual({0, 1, 3}, self.automaton.tags[matcher.state])
+
+    def test_to_dfa(self):
+        dfa = self.automaton.to_dfa()
+        for word in ('elif', '42', 'a0', 'if!'):
+            self.assertEqual(any(p.accept(word) for p in self.patterns),
+                             dfa.accept(word))
+
+
+class LexerTest(unittest.TestCase):
+    def setUp(self):
+        self.lexer = Lexer.create([
+            ('if', to_dfa('if')),
+            ('name', to_dfa('[a-z]+')),
+            ('number', to_dfa(r'\d+(\.\d+)?')),
+            ('space', to_dfa(' +')),
+            ('op', to_nfa('[-+*/=]|==')),
+            ])
+
+    def test_tokenize(self):
+        self.assertListEqual([
+            ('if', 0, 2), ('space', 2, 3), ('name', 3, 7), ('space', 7, 8),
+            ('op', 8, 10), ('space', 10, 12), ('number', 12, 15),
+            ('op', 15, 16), ('number', 16, 17),
+            ], list(self.lexer.tokenize('if iffy ==  4.5-1')))
+        self.assertListEqual([('name', 0, 1), ('op', 1, 2)],
+                             list(self.lexer.tokenize(b'x=')))
+        self.assertListEqual([], list(self.lexer.tokenize('')))
+
+    def test_no_match(self):
+        tokens = self.lexer.tokenize('x=1.')
+        self.assertEqual(('name', 0, 1), next(tokens))
+        self.assertEqual(('op', 1, 2), next(tokens))
+        self.assertEqual(('number', 2, 3), next(tokens))
+        with self.assertRaises(ValueError):
+            next(tokens)
+
+
+class SearchTest(unittest.TestCase):
+    def test_finditer(self):
+        searcher = to_dfa('[a-z]+@[a-z]+\\.com').searcher()
+        text = 'mail foo@bar.com or x@y.com.'
+        self.assertListEqual([(5, 16), (20, 27)],
+                             list(searcher.finditer(text)))
+        self.assertListEqual([(5, 16), (20, 27)],
+                             list(searcher.finditer(text.encode())))
+        self.assertEqual((5, 16), searcher.search(text))
+        self.assertIsNone(searcher.search('no mail here'))
+
+    def test_leftmost_longest(self):
+        automaton = to_dfa('abcd|c|b+')
+        self.assertListEqual([(0, 4), (4, 5), (6, 9)],
+                             list(automaton.finditer('abcdcxbbb')))
+
+        # empty matches, as re.finditer reports them
+        self.assertListEqual([(0, 0), (1, 3), (3, 3)],
+                             list(to_dfa('a*').finditer('baa')))
+
+    def test_nfa(self):
+        automaton = to_nfa('(a|b)*a(a|b)')
+        self.assertEqual((1, 4), automaton.search('cbabac'))
+        self.assertTrue(automaton.reverse().accept('bab'))
+        self.assertFalse(automaton.reverse().accept('abb'))
+
+    def test_mmap(self):
+        searcher = to_dfa('b+').searcher()
+        with tempfile.TemporaryFile() as fp:
+            fp.write(b'a' * 5000 + b'bb' + b'a' * 5000 + b'b')
+            fp.flush()
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self.assertListEqual([(5000, 5002), (10002, 10003)],
+                                     list(searcher.finditer(data)))
+
+
 if __name__ == '__main__':
     unittest.main()